@@ -25,3 +25,51 @@ ADMIN_IDS: list[int] = [
 
 # Путь к базе данных
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///support_bot.db")
+
+# Файл снимка состояния (кэш тикетов, rate limiter) для быстрого перезапуска
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "support_bot.snapshot")
+
+# Рассылка: сообщений в секунду и одновременных запросов к Bot API
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+
+# Логирование: уровень, формат (text / json), доля INFO-записей обработчиков,
+# сколько одинаковых предупреждений и ошибок выводить в минуту
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_INFO_SAMPLE_RATE = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1.0"))
+LOG_ERROR_BURST = int(os.getenv("LOG_ERROR_BURST", "5"))
+
+# Контроль нагрузки: одновременно обрабатываемых апдейтов, из них новых тикетов,
+# максимальная длина очереди и сколько секунд новый тикет может ждать слот
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+ADMISSION_NEW_TICKET_SLOTS = int(os.getenv("ADMISSION_NEW_TICKET_SLOTS", "8"))
+ADMISSION_QUEUE_LIMIT = int(os.getenv("ADMISSION_QUEUE_LIMIT", "200"))
+ADMISSION_NEW_TICKET_TIMEOUT = float(os.getenv("ADMISSION_NEW_TICKET_TIMEOUT", "30"))
+
+# HTTP-сессия Bot API: размер пулов для лёгких запросов и для медиа/long polling,
+# keep-alive и кэш DNS (секунды), таймауты (секунды), ускоренный JSON (нужен orjson)
+HTTP_LIGHT_POOL_SIZE = int(os.getenv("HTTP_LIGHT_POOL_SIZE", "50"))
+HTTP_HEAVY_POOL_SIZE = int(os.getenv("HTTP_HEAVY_POOL_SIZE", "20"))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "60"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_LIGHT_TIMEOUT = float(os.getenv("HTTP_LIGHT_TIMEOUT", "10"))
+HTTP_HEAVY_TIMEOUT = float(os.getenv("HTTP_HEAVY_TIMEOUT", "60"))
+# Таймауты отдельных методов: sendMediaGroup=120,createForumTopic=15
+HTTP_METHOD_TIMEOUTS: dict[str, float] = {
+    name.strip(): float(value)
+    for name, _, value in (
+        item.partition("=") for item in os.getenv("HTTP_METHOD_TIMEOUTS", "").split(",")
+    )
+    if name.strip() and value.strip()
+}
+HTTP_FAST_JSON = os.getenv("HTTP_FAST_JSON", "").lower() in ("1", "true", "yes")
+
+# Запись трафика для replay.py: путь к журналу (пусто - запись выключена)
+# и секрет для хэширования ID (по умолчанию используется токен бота)
+RECORD_PATH = os.getenv("RECORD_PATH", "")
+RECORD_SALT = os.getenv("RECORD_SALT", "")
+
+# Повторяющиеся сообщения: сколько секунд помнить отпечаток и сколько отпечатков на пользователя
+FLOOD_WINDOW = float(os.getenv("FLOOD_WINDOW", "60"))
+FLOOD_MAX_FINGERPRINTS = int(os.getenv("FLOOD_MAX_FINGERPRINTS", "20"))
@@ -1,10 +1,30 @@
 from database.connection import Database, get_db
-from database.models import Base, Ticket, TicketStatus
+from database.models import (
+    Base,
+    BotState,
+    Broadcast,
+    BroadcastDelivery,
+    BulkJob,
+    JobStatus,
+    ProcessedMessage,
+    StatsRollup,
+    Ticket,
+    TicketStatus,
+    TicketTag,
+)
 
 __all__ = [
     "Database",
     "get_db",
     "Base",
+    "BotState",
+    "Broadcast",
+    "BroadcastDelivery",
+    "BulkJob",
+    "JobStatus",
+    "ProcessedMessage",
+    "StatsRollup",
     "Ticket",
     "TicketStatus",
+    "TicketTag",
 ]
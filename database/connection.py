@@ -1,6 +1,7 @@
 """
 Подключение к базе данных
 """
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from config import DATABASE_URL
@@ -17,6 +18,9 @@ class Database:
             class_=AsyncSession,
             expire_on_commit=False
         )
+        
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine.sync_engine, "connect", _enable_sqlite_wal)
     
     async def init_db(self):
         """Инициализация БД - создание таблиц"""
@@ -28,6 +32,18 @@ class Database:
         await self.engine.dispose()
 
 
+def _enable_sqlite_wal(dbapi_connection, connection_record):
+    """
+    Включает WAL для SQLite
+    
+    В режиме WAL читатели не блокируют запись, поэтому длинные потоковые
+    выборки (рассылки) могут идти параллельно с обработкой сообщений.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
+
 # Глобальный экземпляр
 _db: Database | None = None
 
@@ -7,7 +7,7 @@ import string
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import BigInteger, Boolean, DateTime, Enum, ForeignKey, Integer, String, func
+from sqlalchemy import BigInteger, Boolean, DateTime, Enum, ForeignKey, Integer, String, Text, UniqueConstraint, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -21,6 +21,12 @@ class TicketStatus(enum.Enum):
     CLOSED = "closed"
 
 
+class JobStatus(enum.Enum):
+    """Статусы фоновой операции (пакетной или рассылки)"""
+    RUNNING = "running"
+    DONE = "done"
+
+
 class Ticket(Base):
     """Модель тикета"""
     __tablename__ = "tickets"
@@ -53,3 +59,123 @@ class Ticket(Base):
         chars = string.ascii_uppercase + string.digits
         code = ''.join(random.choices(chars, k=4))
         return code
+
+
+class TicketTag(Base):
+    """Метка тикета"""
+    __tablename__ = "ticket_tags"
+    __table_args__ = (UniqueConstraint("ticket_pk", "tag"),)
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    ticket_pk: Mapped[int] = mapped_column(ForeignKey("tickets.id", ondelete="CASCADE"), index=True)
+    tag: Mapped[str] = mapped_column(String(64), index=True)
+
+
+class BulkJob(Base):
+    """
+    Пакетная операция над тикетами
+    
+    Изменения в БД применяются сразу одной транзакцией, а побочные эффекты
+    в Telegram (переименование топиков, уведомления) выполняются фоновой
+    задачей. position - сколько тикетов уже обработано, по нему задача
+    продолжает работу после перезапуска.
+    """
+    __tablename__ = "bulk_jobs"
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    action: Mapped[str] = mapped_column(String(16))  # close / reopen
+    ticket_ids: Mapped[str] = mapped_column(Text)  # JSON-список Ticket.id
+    total: Mapped[int] = mapped_column(Integer)
+    position: Mapped[int] = mapped_column(Integer, default=0)
+    status: Mapped[JobStatus] = mapped_column(Enum(JobStatus), default=JobStatus.RUNNING)
+    admin_id: Mapped[int] = mapped_column(BigInteger)
+    progress_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+class Broadcast(Base):
+    """
+    Рассылка всем пользователям, когда-либо создававшим тикет
+    
+    Сообщение задаётся либо текстом, либо ссылкой на сообщение в админ-группе,
+    которое копируется получателям.
+    """
+    __tablename__ = "broadcasts"
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    admin_id: Mapped[int] = mapped_column(BigInteger)
+    text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    source_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    
+    # Прогресс
+    status: Mapped[JobStatus] = mapped_column(Enum(JobStatus), default=JobStatus.RUNNING)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    progress_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+class BroadcastDelivery(Base):
+    """Результат доставки рассылки одному получателю"""
+    __tablename__ = "broadcast_deliveries"
+    __table_args__ = (UniqueConstraint("broadcast_id", "chat_id"),)
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    broadcast_id: Mapped[int] = mapped_column(ForeignKey("broadcasts.id", ondelete="CASCADE"), index=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    delivered: Mapped[bool] = mapped_column(Boolean)
+    error: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+
+
+class StatsRollup(Base):
+    """
+    Агрегированная статистика за час или день
+    
+    Счётчики обновляются в памяти и периодически сохраняются,
+    гистограммы хранятся в JSON (количество значений по корзинам).
+    """
+    __tablename__ = "stats_rollups"
+    __table_args__ = (UniqueConstraint("period", "bucket_start"),)
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    period: Mapped[str] = mapped_column(String(8))  # hour / day
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, index=True)
+    
+    tickets_created: Mapped[int] = mapped_column(Integer, default=0)
+    tickets_closed: Mapped[int] = mapped_column(Integer, default=0)
+    tickets_reopened: Mapped[int] = mapped_column(Integer, default=0)
+    messages_from_users: Mapped[int] = mapped_column(Integer, default=0)
+    messages_from_admins: Mapped[int] = mapped_column(Integer, default=0)
+    
+    first_response_hist: Mapped[str] = mapped_column(Text, default="[]")
+    resolution_hist: Mapped[str] = mapped_column(Text, default="[]")
+
+
+class BotState(Base):
+    """Служебное состояние бота (ключ-значение)"""
+    __tablename__ = "bot_state"
+    
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[str] = mapped_column(Text)
+
+
+class ProcessedMessage(Base):
+    """
+    Сообщение пользователя, обработка которого началась
+
+    Запись сохраняется до первого побочного эффекта (пересылки, создания
+    тикета), поэтому апдейт, повторно доставленный после падения посреди
+    обработки, распознаётся и после перезапуска.
+    """
+    __tablename__ = "processed_messages"
+    __table_args__ = (UniqueConstraint("chat_id", "message_id"),)
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    message_id: Mapped[int] = mapped_column(Integer)
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), index=True)
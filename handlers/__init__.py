@@ -1,4 +1,7 @@
 from handlers.user_handlers import router as user_router
 from handlers.admin_handlers import router as admin_router
+from handlers.bulk_handlers import router as bulk_router
+from handlers.broadcast_handlers import router as broadcast_router
+from handlers.stats_handlers import router as stats_router
 
-__all__ = ["user_router", "admin_router"]
+__all__ = ["user_router", "admin_router", "bulk_router", "broadcast_router", "stats_router"]
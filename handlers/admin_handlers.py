@@ -10,7 +10,8 @@ from aiogram.enums import ContentType
 
 from config import ADMIN_GROUP_ID, ADMIN_IDS
 from database import get_db
-from services import TicketService
+from services import TicketService, stats, ticket_cache
+from utils import bind_log_context
 from database.models import TicketStatus, Ticket
 
 router = Router()
@@ -74,7 +75,7 @@ async def cmd_close(message: Message, bot: Bot):
                     name=topic_name
                 )
             except Exception as e:
-                logger.error(f"Failed to update topic name: {e}")
+                logger.error("Failed to update topic name: %s", e)
             
             # Уведомляем пользователя
             try:
@@ -84,13 +85,13 @@ async def cmd_close(message: Message, bot: Bot):
                     f"Если у вас возникнут новые вопросы, напишите нам снова."
                 )
             except Exception as e:
-                logger.error(f"Failed to notify user about ticket closure: {e}")
+                logger.error("Failed to notify user about ticket closure: %s", e)
             
             await message.reply(f"✅ Тикет #{ticket.ticket_id} закрыт. Пользователь уведомлён.")
-            logger.info(f"Ticket {ticket.ticket_id} closed by admin {message.from_user.id}")
+            logger.info("Ticket %s closed by admin %s", ticket.ticket_id, message.from_user.id)
             
     except Exception as e:
-        logger.error(f"Error in cmd_close: {e}", exc_info=True)
+        logger.error("Error in cmd_close: %s", e, exc_info=True)
         await message.reply("❌ Ошибка при закрытии тикета.")
 
 
@@ -107,7 +108,7 @@ async def handle_admin_message(message: Message, bot: Bot):
     """
     # Игнорируем сообщения вне топиков
     if not message.message_thread_id:
-        logger.debug(f"Message from admin group without topic_id, ignoring")
+        logger.debug("Message from admin group without topic_id, ignoring")
         return
     
     # Игнорируем служебные события форума
@@ -130,6 +131,22 @@ async def handle_admin_message(message: Message, bot: Bot):
         return
     
     try:
+        # Тикет есть в кэше - пересылаем без запросов к БД
+        cached = ticket_cache.get_by_topic(message.message_thread_id)
+        if cached:
+            bind_log_context(ticket_id=cached.ticket_id)
+            if not cached.is_open:
+                logger.debug("Ticket %s is closed, ignoring message", cached.ticket_id)
+                return
+            
+            logger.info(
+                "Forwarding message from admin %s to user %s (ticket %s)",
+                message.from_user.id, cached.user_id, cached.ticket_id
+            )
+            if await forward_to_user(bot, message, cached.user_chat_id):
+                stats.message_from_admin(cached.pk)
+            return
+        
         async with get_db().session_factory() as session:
             service = TicketService(session)
             
@@ -137,26 +154,29 @@ async def handle_admin_message(message: Message, bot: Bot):
             ticket = await service.get_ticket_by_topic_id(message.message_thread_id)
             
             if not ticket:
-                logger.warning(f"Ticket not found for topic_id={message.message_thread_id}")
+                logger.warning("Ticket not found for topic_id=%s", message.message_thread_id)
                 return
             
+            bind_log_context(ticket_id=ticket.ticket_id)
+            
             if ticket.status == TicketStatus.CLOSED:
-                logger.debug(f"Ticket {ticket.ticket_id} is closed, ignoring message")
+                logger.debug("Ticket %s is closed, ignoring message", ticket.ticket_id)
                 return
             
             # Пересылаем сообщение пользователю
             logger.info(
-                f"Forwarding message from admin {message.from_user.id} "
-                f"to user {ticket.user_id} (ticket {ticket.ticket_id})"
+                "Forwarding message from admin %s to user %s (ticket %s)",
+                message.from_user.id, ticket.user_id, ticket.ticket_id
             )
             
-            await forward_to_user(bot, message, ticket.user_chat_id)
+            if await forward_to_user(bot, message, ticket.user_chat_id):
+                stats.message_from_admin(ticket.id)
             
     except Exception as e:
-        logger.error(f"Error in handle_admin_message: {e}", exc_info=True)
+        logger.error("Error in handle_admin_message: %s", e, exc_info=True)
 
 
-async def forward_to_user(bot: Bot, message: Message, user_chat_id: int):
+async def forward_to_user(bot: Bot, message: Message, user_chat_id: int) -> bool:
     """Пересылает сообщение пользователю"""
     try:
         from aiogram.enums import ContentType
@@ -182,10 +202,12 @@ async def forward_to_user(bot: Bot, message: Message, user_chat_id: int):
         else:
             await bot.send_message(user_chat_id, f"[Неподдерживаемый тип: {message.content_type}]")
         
-        logger.info(f"✅ Successfully forwarded message to user {user_chat_id}")
+        logger.info("✅ Successfully forwarded message to user %s", user_chat_id)
+        return True
         
     except Exception as e:
-        logger.error(f"Failed to forward to user {user_chat_id}: {e}", exc_info=True)
+        logger.error("Failed to forward to user %s: %s", user_chat_id, e, exc_info=True)
+        return False
 
 
 def format_topic_name_closed(ticket: Ticket) -> str:
@@ -0,0 +1,263 @@
+"""
+Рассылка объявлений всем пользователям, создававшим тикеты
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aiogram import Router, Bot
+from aiogram.types import Message
+from aiogram.utils.text_decorations import html_decoration
+from aiogram.filters import Command, CommandObject
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from config import ADMIN_GROUP_ID, BROADCAST_CONCURRENCY, BROADCAST_RATE
+from database import get_db
+from database.models import Broadcast
+from handlers.admin_handlers import is_admin, is_admin_group
+from services import BroadcastService
+from utils import Throttle
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+# Результаты доставки пишутся в БД пачками не больше FLUSH_SIZE и не реже
+# раза в FLUSH_INTERVAL секунд: после падения повторно получат рассылку
+# только получатели из незаписанной пачки
+FLUSH_SIZE = 10
+FLUSH_INTERVAL = 1.0
+
+# Как часто обновлять сообщение с прогрессом (секунды)
+PROGRESS_INTERVAL = 5.0
+
+# Ссылки на фоновые задачи, чтобы их не собрал GC
+_broadcasts: set[asyncio.Task] = set()
+
+
+@router.message(Command("broadcast"))
+async def cmd_broadcast(message: Message, bot: Bot, command: CommandObject):
+    """
+    Команда /broadcast - рассылка всем пользователям
+
+    Использование: /broadcast текст
+    или ответом на сообщение в админ-группе, которое нужно разослать
+    """
+    if not is_admin_group(message):
+        return
+
+    if not is_admin(message.from_user.id):
+        return
+
+    source = message.reply_to_message
+    # В топиках форума reply_to_message указывает на служебное сообщение о создании топика
+    if source and source.forum_topic_created:
+        source = None
+
+    if not source and not command.args:
+        await message.reply(
+            "❌ Укажите текст: /broadcast текст\n"
+            "или отправьте /broadcast ответом на сообщение для рассылки."
+        )
+        return
+
+    try:
+        async with get_db().session_factory() as session:
+            broadcast = await BroadcastService(session).create_broadcast(
+                admin_id=message.from_user.id,
+                text=None if source else broadcast_html(message, command.args),
+                source_message_id=source.message_id if source else None
+            )
+    except Exception as e:
+        logger.error("Error in cmd_broadcast: %s", e, exc_info=True)
+        await message.reply("❌ Ошибка при создании рассылки.")
+        return
+
+    logger.info("Broadcast %s (%s recipients) started by admin %s", broadcast.id, broadcast.total, message.from_user.id)
+    await message.reply(f"📣 Рассылка #{broadcast.id} запущена: {broadcast.total} получателей.")
+    start_broadcast(bot, broadcast.id)
+
+
+def broadcast_html(message: Message, args: str) -> str:
+    """Текст рассылки в HTML с форматированием администратора, без самой команды"""
+    text = message.text
+    start = len(text) - len(args)
+    # Смещения сущностей считаются в UTF-16
+    offset = len(text[:start].encode("utf-16-le")) // 2
+    entities = []
+    for entity in message.entities or []:
+        end = entity.offset + entity.length
+        if end <= offset:
+            continue
+        begin = max(entity.offset, offset)
+        entities.append(entity.model_copy(update={"offset": begin - offset, "length": end - begin}))
+    return html_decoration.unparse(args, entities)
+
+
+def start_broadcast(bot: Bot, broadcast_id: int):
+    """Запускает рассылку в фоне"""
+    task = asyncio.create_task(run_broadcast(bot, broadcast_id))
+    _broadcasts.add(task)
+    task.add_done_callback(_broadcasts.discard)
+
+
+async def resume_broadcasts(bot: Bot):
+    """Продолжает рассылки, прерванные перезапуском"""
+    async with get_db().session_factory() as session:
+        broadcasts = await BroadcastService(session).get_unfinished_broadcasts()
+
+    for broadcast in broadcasts:
+        done = broadcast.sent + broadcast.failed
+        logger.info("Resuming broadcast %s at %s/%s", broadcast.id, done, broadcast.total)
+        start_broadcast(bot, broadcast.id)
+
+
+async def run_broadcast(bot: Bot, broadcast_id: int):
+    """
+    Отправляет рассылку с ограничением скорости и числа одновременных запросов
+
+    Получатели читаются потоково, результаты доставки пишутся небольшими
+    пачками. Получатели, для которых результат уже записан, при продолжении
+    пропускаются. При любом выходе незавершённые отправки отменяются, а
+    полученные результаты записываются.
+    """
+    db = get_db()
+    throttle = Throttle(BROADCAST_RATE, burst=BROADCAST_CONCURRENCY)
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    results: list[tuple[int, bool, Optional[str]]] = []
+    tasks: set[asyncio.Task] = set()
+
+    try:
+        async with db.session_factory() as reader, db.session_factory() as writer:
+            service = BroadcastService(writer)
+            broadcast = await writer.get(Broadcast, broadcast_id)
+            if broadcast is None:
+                return
+
+            if broadcast.progress_message_id is None:
+                try:
+                    progress = await bot.send_message(int(ADMIN_GROUP_ID), format_progress(broadcast))
+                    await service.update_broadcast(broadcast, progress_message_id=progress.message_id)
+                except Exception as e:
+                    logger.warning("Failed to send broadcast progress: %s", e)
+
+            started_at = time.monotonic()
+            done_at_start = broadcast.sent + broadcast.failed
+            last_report = last_flush = started_at
+
+            async def deliver(chat_id: int):
+                try:
+                    results.append(await send_broadcast_message(bot, broadcast, chat_id, throttle))
+                finally:
+                    semaphore.release()
+
+            async def flush():
+                nonlocal last_flush
+                last_flush = time.monotonic()
+                if results:
+                    batch = results[:]
+                    results.clear()
+                    await service.save_deliveries(broadcast, batch)
+
+            try:
+                async for chat_id in BroadcastService(reader).stream_pending_chat_ids(broadcast.id):
+                    await semaphore.acquire()
+                    await throttle.acquire()
+
+                    task = asyncio.create_task(deliver(chat_id))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+                    if len(results) >= FLUSH_SIZE or time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                        await flush()
+
+                    if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                        await report_progress(bot, broadcast, started_at, done_at_start)
+                        last_report = time.monotonic()
+
+                if tasks:
+                    await asyncio.gather(*tasks)
+            finally:
+                # Ошибка или отмена: незавершённые отправки отменяются (они
+                # будут повторены при продолжении), завершённые записываются
+                for task in list(tasks):
+                    task.cancel()
+                if tasks:
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                try:
+                    await flush()
+                except Exception as e:
+                    logger.error("Failed to save broadcast %s deliveries: %s", broadcast_id, e)
+
+            await service.update_broadcast(broadcast, finished=True)
+            await report_progress(bot, broadcast, started_at, done_at_start)
+            logger.info("Broadcast %s finished: sent=%s, failed=%s", broadcast.id, broadcast.sent, broadcast.failed)
+
+    except Exception as e:
+        logger.error("Error in broadcast %s: %s", broadcast_id, e, exc_info=True)
+
+
+async def send_broadcast_message(
+    bot: Bot,
+    broadcast: Broadcast,
+    chat_id: int,
+    throttle: Throttle,
+    max_retries: int = 3
+) -> tuple[int, bool, Optional[str]]:
+    """
+    Отправляет рассылку одному получателю
+
+    Returns:
+        (chat_id, delivered, error)
+    """
+    error: Optional[str] = None
+    for attempt in range(max_retries):
+        try:
+            if broadcast.source_message_id:
+                await bot.copy_message(chat_id, int(ADMIN_GROUP_ID), broadcast.source_message_id)
+            else:
+                await bot.send_message(chat_id, broadcast.text)
+            return chat_id, True, None
+        except TelegramRetryAfter as e:
+            logger.warning("Flood control: waiting %s seconds (attempt %s/%s)", e.retry_after, attempt + 1, max_retries)
+            throttle.pause(e.retry_after)
+            await asyncio.sleep(e.retry_after)
+            error = str(e)
+        except TelegramForbiddenError as e:
+            # Пользователь заблокировал бота
+            return chat_id, False, str(e)
+        except Exception as e:
+            logger.debug("Failed to deliver broadcast %s to %s: %s", broadcast.id, chat_id, e)
+            return chat_id, False, str(e)
+    return chat_id, False, error
+
+
+async def report_progress(bot: Bot, broadcast: Broadcast, started_at: float, done_at_start: int):
+    """Обновляет сообщение с прогрессом рассылки"""
+    if broadcast.progress_message_id is None:
+        return
+
+    elapsed = time.monotonic() - started_at
+    done = broadcast.sent + broadcast.failed
+    rate = (done - done_at_start) / elapsed if elapsed > 0 else 0.0
+    try:
+        await bot.edit_message_text(
+            format_progress(broadcast, rate),
+            chat_id=int(ADMIN_GROUP_ID),
+            message_id=broadcast.progress_message_id
+        )
+    except Exception as e:
+        logger.debug("Failed to update broadcast progress: %s", e)
+
+
+def format_progress(broadcast: Broadcast, rate: float = 0.0) -> str:
+    """Форматирует прогресс рассылки"""
+    done = broadcast.sent + broadcast.failed
+    percent = min(done * 100 // broadcast.total, 100) if broadcast.total else 100
+    status = "⏳ выполняется" if broadcast.finished_at is None else "✅ завершена"
+    return (
+        f"📣 <b>Рассылка #{broadcast.id}</b>: {status}\n"
+        f"{done}/{broadcast.total} ({percent}%)\n"
+        f"✉️ Доставлено: {broadcast.sent} | ⚠️ Ошибок: {broadcast.failed}\n"
+        f"⚡️ {rate:.1f} сообщ./с"
+    )
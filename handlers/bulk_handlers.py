@@ -0,0 +1,308 @@
+"""
+Пакетные операции администраторов над тикетами
+Команды вызываются в админ-группе, прогресс публикуется в общем топике
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import Router, Bot
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import ADMIN_GROUP_ID
+from database import get_db
+from database.models import BulkJob, Ticket, TicketStatus
+from handlers.admin_handlers import is_admin, is_admin_group
+from handlers.user_handlers import format_topic_name
+from services import TicketService
+from utils import Throttle
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+# Изменение топиков - это запросы в группу (~20 в минуту),
+# уведомления идут в разные личные чаты (~30 в секунду на бота)
+GROUP_RATE = 20 / 60
+USERS_RATE = 25.0
+
+# Сколько тикетов загружать из БД за раз
+CHUNK_SIZE = 100
+
+# Как часто обновлять сообщение с прогрессом (секунды); правки идут в ту же
+# группу, что и переименования топиков, и расходуют тот же лимит
+PROGRESS_INTERVAL = 30.0
+
+FILTERS_HELP = (
+    "Фильтры: <code>older=7d</code> (старше N минут/часов/дней: m/h/d), "
+    "<code>user=123456</code>, <code>status=open|closed</code> (только для /bulk_tag)"
+)
+
+UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+# Ссылки на фоновые задачи, чтобы их не собрал GC
+_jobs: set[asyncio.Task] = set()
+_group_throttle = Throttle(GROUP_RATE)
+_users_throttle = Throttle(USERS_RATE, burst=5)
+
+
+def parse_filters(args: list[str], allow_status: bool = False) -> dict[str, Any]:
+    """
+    Разбирает фильтры вида key=value
+
+    Raises:
+        ValueError: с текстом ошибки для администратора
+    """
+    filters: dict[str, Any] = {}
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Некорректный фильтр: {arg}")
+
+        if key == "older":
+            unit = UNITS.get(value[-1])
+            if unit is None or not value[:-1].isdigit():
+                raise ValueError(f"Некорректный возраст: {value}")
+            filters["older_than"] = timedelta(**{unit: int(value[:-1])})
+        elif key == "user":
+            if not value.isdigit():
+                raise ValueError(f"Некорректный user_id: {value}")
+            filters["user_id"] = int(value)
+        elif key == "status" and allow_status:
+            try:
+                filters["status"] = TicketStatus(value)
+            except ValueError:
+                raise ValueError(f"Некорректный статус: {value}")
+        else:
+            raise ValueError(f"Неизвестный фильтр: {key}")
+    return filters
+
+
+def check_bulk_command(message: Message) -> bool:
+    """Проверяет, что пакетную команду вызвал администратор в админ-группе"""
+    return is_admin_group(message) and is_admin(message.from_user.id)
+
+
+@router.message(Command("bulk_close", "bulk_reopen"))
+async def cmd_bulk_status(message: Message, bot: Bot, command: CommandObject):
+    """
+    Команды /bulk_close и /bulk_reopen - закрыть или переоткрыть много тикетов
+
+    Использование: /bulk_close older=7d user=123456
+    Без фильтров команда не выполняется: для всех тикетов нужно явно указать all
+    """
+    if not check_bulk_command(message):
+        return
+
+    args = (command.args or "").split()
+    select_all = "all" in args
+    try:
+        filters = parse_filters([arg for arg in args if arg != "all"])
+    except ValueError as e:
+        await message.reply(f"❌ {e}\n\n{FILTERS_HELP}")
+        return
+
+    if not filters and not select_all:
+        await message.reply(
+            f"❌ Укажите хотя бы один фильтр или <code>all</code>, "
+            f"чтобы обработать все тикеты: /{command.command} all\n\n{FILTERS_HELP}"
+        )
+        return
+
+    status = TicketStatus.CLOSED if command.command == "bulk_close" else TicketStatus.OPEN
+
+    try:
+        async with get_db().session_factory() as session:
+            service = TicketService(session)
+            job = await service.bulk_set_status(status, admin_id=message.from_user.id, **filters)
+    except Exception as e:
+        logger.error("Error in cmd_bulk_status: %s", e, exc_info=True)
+        await message.reply("❌ Ошибка при выполнении пакетной операции.")
+        return
+
+    if job is None:
+        await message.reply("ℹ️ Под фильтр не попал ни один тикет.")
+        return
+
+    logger.info("Bulk job %s (%s, %s tickets) started by admin %s", job.id, job.action, job.total, message.from_user.id)
+    await message.reply(
+        f"✅ Статус обновлён у {job.total} тикетов.\n"
+        f"Топики и уведомления обрабатываются в фоне, прогресс - в общем топике."
+    )
+    start_bulk_job(bot, job.id)
+
+
+@router.message(Command("bulk_tag"))
+async def cmd_bulk_tag(message: Message, command: CommandObject):
+    """
+    Команда /bulk_tag - пометить много тикетов
+
+    Использование: /bulk_tag outage older=1d status=open
+    """
+    if not check_bulk_command(message):
+        return
+
+    args = (command.args or "").split()
+    if not args or "=" in args[0]:
+        await message.reply(f"❌ Укажите метку: /bulk_tag &lt;метка&gt; [фильтры]\n\n{FILTERS_HELP}")
+        return
+
+    tag = args[0][:64]
+    try:
+        filters = parse_filters(args[1:], allow_status=True)
+    except ValueError as e:
+        await message.reply(f"❌ {e}\n\n{FILTERS_HELP}")
+        return
+
+    try:
+        async with get_db().session_factory() as session:
+            service = TicketService(session)
+            ids = await service.find_ticket_ids(**filters)
+            added = await service.bulk_add_tag(tag, ids)
+    except Exception as e:
+        logger.error("Error in cmd_bulk_tag: %s", e, exc_info=True)
+        await message.reply("❌ Ошибка при выполнении пакетной операции.")
+        return
+
+    await message.reply(f"🏷 Метка «{tag}» добавлена {added} тикетам (подходит под фильтр: {len(ids)}).")
+
+
+def start_bulk_job(bot: Bot, job_id: int):
+    """Запускает обработку пакетной операции в фоне"""
+    task = asyncio.create_task(run_bulk_job(bot, job_id))
+    _jobs.add(task)
+    task.add_done_callback(_jobs.discard)
+
+
+async def resume_bulk_jobs(bot: Bot):
+    """Продолжает пакетные операции, прерванные перезапуском"""
+    async with get_db().session_factory() as session:
+        jobs = await TicketService(session).get_unfinished_bulk_jobs()
+
+    for job in jobs:
+        logger.info("Resuming bulk job %s at %s/%s", job.id, job.position, job.total)
+        start_bulk_job(bot, job.id)
+
+
+async def run_bulk_job(bot: Bot, job_id: int):
+    """Выполняет побочные эффекты пакетной операции в Telegram"""
+    try:
+        async with get_db().session_factory() as session:
+            service = TicketService(session)
+            job = await session.get(BulkJob, job_id)
+            if job is None:
+                return
+
+            ids: list[int] = json.loads(job.ticket_ids)
+
+            if job.progress_message_id is None:
+                progress = await call_throttled(
+                    _group_throttle,
+                    lambda: bot.send_message(int(ADMIN_GROUP_ID), format_progress(job))
+                )
+                if progress:
+                    await service.update_bulk_job(job, progress_message_id=progress.message_id)
+
+            last_report = time.monotonic()
+
+            while job.position < job.total:
+                chunk = ids[job.position:job.position + CHUNK_SIZE]
+                tickets = await service.get_tickets_by_ids(chunk)
+
+                for pk in chunk:
+                    ticket = tickets.get(pk)
+                    if ticket:
+                        await apply_side_effects(bot, job.action, ticket)
+
+                    # Сохраняем прогресс после каждого тикета, чтобы после
+                    # перезапуска не отправлять уведомления повторно
+                    await service.update_bulk_job(job, position=job.position + 1)
+
+                    if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                        await report_progress(bot, job)
+                        last_report = time.monotonic()
+
+            await service.update_bulk_job(job, finished=True)
+            await report_progress(bot, job)
+            logger.info("Bulk job %s finished (%s tickets)", job.id, job.total)
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error("Error in bulk job %s: %s", job_id, e, exc_info=True)
+
+
+async def apply_side_effects(bot: Bot, action: str, ticket: Ticket):
+    """Переименовывает топик и уведомляет пользователя"""
+    # Тикет мог изменить статус после запуска операции
+    expected = TicketStatus.CLOSED if action == "close" else TicketStatus.OPEN
+    if ticket.status != expected:
+        return
+
+    if ticket.topic_id:
+        await call_throttled(
+            _group_throttle,
+            lambda: bot.edit_forum_topic(
+                chat_id=int(ADMIN_GROUP_ID),
+                message_thread_id=ticket.topic_id,
+                name=format_topic_name(ticket)
+            )
+        )
+
+    if action == "close":
+        await call_throttled(
+            _users_throttle,
+            lambda: bot.send_message(
+                ticket.user_chat_id,
+                f"✅ Ваше обращение #{ticket.ticket_id} закрыто.\n\n"
+                f"Если у вас возникнут новые вопросы, напишите нам снова."
+            )
+        )
+
+
+async def call_throttled(
+    throttle: Throttle,
+    call: Callable[[], Awaitable[Any]],
+    max_retries: int = 3
+) -> Optional[Any]:
+    """Вызывает Bot API с учётом ограничения скорости и flood control"""
+    for attempt in range(max_retries):
+        await throttle.acquire()
+        try:
+            return await call()
+        except TelegramRetryAfter as e:
+            logger.warning("Flood control: waiting %s seconds (attempt %s/%s)", e.retry_after, attempt + 1, max_retries)
+            throttle.pause(e.retry_after)
+        except Exception as e:
+            logger.warning("Bulk side effect failed: %s", e)
+            return None
+    return None
+
+
+async def report_progress(bot: Bot, job: BulkJob):
+    """Обновляет сообщение с прогрессом в общем топике"""
+    if job.progress_message_id is None:
+        return
+    await call_throttled(
+        _group_throttle,
+        lambda: bot.edit_message_text(
+            format_progress(job),
+            chat_id=int(ADMIN_GROUP_ID),
+            message_id=job.progress_message_id
+        )
+    )
+
+
+def format_progress(job: BulkJob) -> str:
+    """Форматирует прогресс пакетной операции"""
+    action = "Закрытие" if job.action == "close" else "Переоткрытие"
+    percent = job.position * 100 // job.total if job.total else 100
+    status = "✅ завершено" if job.position >= job.total else "⏳ выполняется"
+    return (
+        f"📦 <b>{action} тикетов #{job.id}</b>: {status}\n"
+        f"{job.position}/{job.total} ({percent}%)"
+    )
@@ -0,0 +1,128 @@
+"""
+Статистика поддержки для администраторов
+"""
+from typing import Optional
+
+from aiogram import Bot, Router
+from aiogram.types import Message
+from aiogram.filters import Command
+
+from handlers.admin_handlers import is_admin, is_admin_group
+from services import stats
+from services.stats_service import Rollup
+from utils import Priority, TunedAiohttpSession, admission
+
+router = Router()
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message, bot: Bot):
+    """
+    Команда /stats - статистика поддержки
+
+    Все значения берутся из счётчиков в памяти, без запросов к БД
+    """
+    if not is_admin_group(message):
+        return
+
+    if not is_admin(message.from_user.id):
+        return
+
+    oldest = stats.oldest_awaiting()
+    oldest_part = f" (дольше всех: {format_duration(oldest)})" if oldest is not None else ""
+
+    await message.reply(
+        "📊 <b>Статистика поддержки</b>\n\n"
+        f"🟢 Открытых тикетов: <b>{stats.open_tickets}</b>\n"
+        f"⏳ Ждут первого ответа: <b>{len(stats.awaiting_response)}</b>{oldest_part}\n\n"
+        f"🕐 <b>За текущий час</b>\n{format_rollup(stats.rollup('hour'))}\n\n"
+        f"📅 <b>За сегодня (UTC)</b>\n{format_rollup(stats.rollup('day'))}"
+        f"{format_latency()}\n\n"
+        f"{format_admission()}"
+        f"{format_http(bot)}"
+    )
+
+
+def format_rollup(rollup: Rollup) -> str:
+    """Форматирует счётчики за период"""
+    return (
+        f"Создано: {rollup.tickets_created} | Закрыто: {rollup.tickets_closed} | "
+        f"Переоткрыто: {rollup.tickets_reopened}\n"
+        f"Сообщений: от пользователей {rollup.messages_from_users}, "
+        f"от администраторов {rollup.messages_from_admins}\n"
+        f"Первый ответ: p50 {format_bound(rollup.first_response.percentile(0.5))}, "
+        f"p90 {format_bound(rollup.first_response.percentile(0.9))}\n"
+        f"Решение: p50 {format_bound(rollup.resolution.percentile(0.5))}, "
+        f"p90 {format_bound(rollup.resolution.percentile(0.9))}"
+    )
+
+
+def format_latency() -> str:
+    """Форматирует задержки этапов обработки с момента запуска"""
+    if not stats.latency:
+        return ""
+    lines = [
+        f"{stage}: p50 {format_ms(histogram.percentile(0.5))}, "
+        f"p90 {format_ms(histogram.percentile(0.9))} ({histogram.total})"
+        for stage, histogram in stats.latency.items()
+    ]
+    return "\n\n⏱ <b>Задержки этапов (с запуска)</b>\n" + "\n".join(lines)
+
+
+def format_admission() -> str:
+    """Форматирует состояние контроля нагрузки"""
+    metrics = admission.metrics()
+    queued = metrics["queued"]
+    admitted = metrics["admitted"]
+    return (
+        "🚦 <b>Нагрузка</b>\n"
+        f"В обработке: {metrics['in_flight']}/{admission.max_in_flight} "
+        f"(новых тикетов {metrics['in_flight_new']}/{admission.new_ticket_slots})\n"
+        f"В очереди: админы {queued[Priority.ADMIN]}, открытые {queued[Priority.EXISTING]}, "
+        f"новые {queued[Priority.NEW]}\n"
+        f"Принято: админы {admitted[Priority.ADMIN]}, открытые {admitted[Priority.EXISTING]}, "
+        f"новые {admitted[Priority.NEW]}\n"
+        f"Отложено: {metrics['deferred']} | Отклонено: {metrics['shed']}"
+    )
+
+
+def format_http(bot: Bot) -> str:
+    """Форматирует статистику пулов соединений Bot API"""
+    if not isinstance(bot.session, TunedAiohttpSession):
+        return ""
+    lines = [
+        f"{name}: запросов {pool.requests}, соединений {pool.connections_created}, "
+        f"повторных {pool.reuse_ratio:.0%}, "
+        f"на соединение {pool.requests_per_connection:.1f}, ошибок {pool.errors}"
+        for name, pool in bot.session.pool_stats.items()
+    ]
+    return "\n\n🔌 <b>Соединения Bot API</b>\n" + "\n".join(lines)
+
+
+def format_ms(bound: Optional[int]) -> str:
+    """Форматирует верхнюю границу корзины гистограммы задержек"""
+    if bound is None:
+        return "—"
+    if bound < 0:
+        return "&gt; 10 с"
+    return f"≤ {bound} мс"
+
+
+def format_bound(seconds: Optional[int]) -> str:
+    """Форматирует верхнюю границу корзины гистограммы"""
+    if seconds is None:
+        return "—"
+    if seconds < 0:
+        return "&gt; 7 д"
+    return f"≤ {format_duration(seconds)}"
+
+
+def format_duration(seconds: float) -> str:
+    """Форматирует длительность: 45 с, 12 мин, 3 ч, 2 д"""
+    if seconds < 60:
+        return f"{int(seconds)} с"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} мин"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)} ч"
+    return f"{int(seconds // 86400)} д"
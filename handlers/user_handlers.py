@@ -4,21 +4,34 @@
 """
 import logging
 import asyncio
+import time
+from typing import Awaitable, TypeVar
 from aiogram import Router, Bot
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
 from aiogram.enums import ContentType
 from aiogram.exceptions import TelegramRetryAfter
+from sqlalchemy.exc import IntegrityError
 
 from config import ADMIN_GROUP_ID
 from database import get_db
-from database.models import Ticket, TicketStatus
-from services import TicketService
-from utils import rate_limiter
+from database.models import ProcessedMessage, Ticket, TicketStatus
+from services import TicketService, stats, ticket_cache
+from utils import bind_log_context, flood_filter, idempotency, rate_limiter
+
+T = TypeVar("T")
 
 router = Router()
+# Повторы одного и того же сообщения отбрасываются до обработчика
+router.message.middleware(flood_filter)
 logger = logging.getLogger(__name__)
 
+TICKET_RECEIVED_TEXT = (
+    "✅ <b>Обращение получено</b>\n\n"
+    "Мы получили ваше сообщение и постараемся ответить как можно скорее.\n\n"
+    "💬 Вы можете дополнить свой запрос, отправив новое сообщение."
+)
+
 
 @router.message(Command("start"))
 async def cmd_start(message: Message):
@@ -81,26 +94,36 @@ async def handle_user_message(message: Message, bot: Bot):
         return
     
     try:
+        # Открытый тикет есть в кэше - пересылаем без запросов к БД
+        cached = ticket_cache.get_by_user(message.from_user.id)
+        if cached and cached.is_open and cached.topic_id:
+            bind_log_context(ticket_id=cached.ticket_id)
+            logger.info("Adding message to existing ticket %s (topic_id=%s)", cached.ticket_id, cached.topic_id)
+            if await idempotency.claim(message):
+                await send_message_to_topic_safe(bot, message, cached.topic_id)
+            return
+        
         async with get_db().session_factory() as session:
             service = TicketService(session)
             
             user_id = message.from_user.id
-            user_chat_id = message.chat.id
             
             # Проверяем, есть ли открытый тикет
             ticket = await service.get_open_ticket_by_user(user_id)
             
             if ticket:
                 # Тикет существует - отправляем в существующий топик
-                logger.info(f"Adding message to existing ticket {ticket.ticket_id} (topic_id={ticket.topic_id})")
+                bind_log_context(ticket_id=ticket.ticket_id)
+                logger.info("Adding message to existing ticket %s (topic_id=%s)", ticket.ticket_id, ticket.topic_id)
                 
                 if not ticket.topic_id:
-                    logger.error(f"Ticket {ticket.ticket_id} has no topic_id!")
+                    logger.error("Ticket %s has no topic_id!", ticket.ticket_id)
                     await message.answer("❌ Ошибка: тикет не привязан к топику. Обратитесь к администратору.")
                     return
                 
                 # Отправляем сообщение в топик с обработкой flood control
-                await send_message_to_topic_safe(bot, message, ticket.topic_id)
+                if await idempotency.claim(message):
+                    await send_message_to_topic_safe(bot, message, ticket.topic_id)
                 
             else:
                 # Проверяем, есть ли закрытый тикет для переоткрытия
@@ -108,8 +131,11 @@ async def handle_user_message(message: Message, bot: Bot):
                 
                 if last_ticket and last_ticket.status == TicketStatus.CLOSED and last_ticket.topic_id:
                     # Переоткрываем закрытый тикет
-                    logger.info(f"Reopening closed ticket {last_ticket.ticket_id} (topic_id={last_ticket.topic_id})")
+                    bind_log_context(ticket_id=last_ticket.ticket_id)
+                    logger.info("Reopening closed ticket %s (topic_id=%s)", last_ticket.ticket_id, last_ticket.topic_id)
                     
+                    if not await idempotency.claim(message):
+                        return
                     await service.reopen_ticket(last_ticket)
                     
                     # Обновляем название топика
@@ -121,78 +147,146 @@ async def handle_user_message(message: Message, bot: Bot):
                             name=topic_name
                         )
                     except Exception as e:
-                        logger.error(f"Failed to update topic name: {e}")
+                        logger.error("Failed to update topic name: %s", e)
                     
                     # Отправляем сообщение в переоткрытый топик
                     await send_message_to_topic_safe(bot, message, last_ticket.topic_id)
                     
-                    await message.answer(
-                        "✅ <b>Обращение получено</b>\n\n"
-                        "Мы получили ваше сообщение и постараемся ответить как можно скорее.\n\n"
-                        "💬 Вы можете дополнить свой запрос, отправив новое сообщение."
-                    )
+                    await message.answer(TICKET_RECEIVED_TEXT)
                     
                 else:
                     # Создаём новый тикет
-                    logger.info(f"Creating new ticket for user {user_id}")
-                    
-                    ticket = await service.create_ticket(
-                        user_id=user_id,
-                        user_chat_id=user_chat_id,
-                        username=message.from_user.username,
-                        full_name=message.from_user.full_name
-                    )
-                    
-                    # Создаём топик в админ-группе
-                    topic_name = format_topic_name(ticket)
-                    
-                    try:
-                        topic = await bot.create_forum_topic(
-                            chat_id=int(ADMIN_GROUP_ID),
-                            name=topic_name
-                        )
-                        topic_id = topic.message_thread_id
-                        
-                        # Сохраняем topic_id в тикет
-                        await service.set_topic_id(ticket, topic_id)
-                        logger.info(f"Created topic {topic_id} for ticket {ticket.ticket_id}")
-                        
-                        # Отправляем информацию о профиле пользователя и закрепляем
-                        profile_info = await send_user_profile_info(bot, ticket, topic_id)
-                        
-                        if profile_info:
-                            try:
-                                # В aiogram 3.x pin_chat_message не поддерживает message_thread_id напрямую
-                                # Используем прямой вызов API
-                                from aiogram.methods import PinChatMessage
-                                
-                                await bot(PinChatMessage(
-                                    chat_id=int(ADMIN_GROUP_ID),
-                                    message_id=profile_info.message_id,
-                                    message_thread_id=topic_id
-                                ))
-                                logger.info(f"Pinned profile info message in topic {topic_id}")
-                            except Exception as e:
-                                logger.warning(f"Failed to pin message (may not be supported): {e}")
-                        
-                        # Отправляем первое сообщение в топик
-                        await send_message_to_topic_safe(bot, message, topic_id)
-                        
-                        await message.answer(
-                            "✅ <b>Обращение получено</b>\n\n"
-                            "Мы получили ваше сообщение и постараемся ответить как можно скорее.\n\n"
-                            "💬 Вы можете дополнить свой запрос, отправив новое сообщение."
-                        )
-                        
-                    except Exception as e:
-                        logger.error(f"Failed to create forum topic: {e}", exc_info=True)
-                        await message.answer("❌ Не удалось создать обращение. Попробуйте позже.")
+                    logger.info("Creating new ticket for user %s", user_id)
+                    await create_ticket_pipeline(bot, message, service)
                     
     except Exception as e:
-        logger.error(f"Error in handle_user_message: {e}", exc_info=True)
+        logger.error("Error in handle_user_message: %s", e, exc_info=True)
         await message.answer("❌ Произошла ошибка. Попробуйте позже.")
 
 
+async def create_ticket_pipeline(bot: Bot, message: Message, service: TicketService):
+    """
+    Создание нового тикета
+    
+    Этапы выполняются как граф зависимостей, независимые - параллельно:
+    
+                     ┌→ ack ──────────────────────────────┐
+        create_row ──┴→ create_topic ─┬→ set_topic_id ─────┤
+                                      ├→ profile → pin ────┤
+                                      └→ relay ────────────┘
+    
+    Подтверждение уходит пользователю сразу после записи тикета: в той же
+    транзакции сохраняется отметка об обработке сообщения, поэтому повторно
+    доставленный апдейт не получит второго подтверждения. При ошибке создания
+    или привязки топика тикет удаляется (и топик, если он создан),
+    пользователь получает сообщение об ошибке. Задержка каждого этапа
+    попадает в статистику.
+    """
+    ack: asyncio.Task | None = None
+    
+    async def notify(text: str):
+        # Сообщение об ошибке не должно прийти раньше подтверждения
+        if ack is not None:
+            await asyncio.gather(ack, return_exceptions=True)
+        try:
+            await message.answer(text)
+        except Exception as e:
+            logger.error("Failed to notify user: %s", e)
+    
+    started_at = time.perf_counter()
+    try:
+        try:
+            ticket = await timed("create_row", service.create_ticket(
+                user_id=message.from_user.id,
+                user_chat_id=message.chat.id,
+                username=message.from_user.username,
+                full_name=message.from_user.full_name,
+                message_id=message.message_id
+            ))
+        except IntegrityError as e:
+            await service.session.rollback()
+            if ProcessedMessage.__tablename__ not in str(e.orig):
+                raise
+            # Сообщение уже обрабатывалось до перезапуска
+            logger.info("Message %s was already processed, skipping ticket creation", message.message_id)
+            return
+        bind_log_context(ticket_id=ticket.ticket_id)
+        ack = asyncio.create_task(timed("ack", message.answer(TICKET_RECEIVED_TEXT)))
+        
+        # Создаём топик в админ-группе
+        try:
+            topic = await timed("create_topic", bot.create_forum_topic(
+                chat_id=int(ADMIN_GROUP_ID),
+                name=format_topic_name(ticket)
+            ))
+        except Exception as e:
+            logger.error("Failed to create forum topic: %s", e, exc_info=True)
+            await service.delete_ticket(ticket)
+            await notify("❌ Не удалось создать обращение. Попробуйте позже.")
+            return
+        
+        topic_id = topic.message_thread_id
+        linked, _, relayed = await asyncio.gather(
+            timed("set_topic_id", service.set_topic_id(ticket, topic_id)),
+            timed("profile", send_and_pin_profile_info(bot, ticket, topic_id)),
+            timed("relay", send_message_to_topic_safe(bot, message, topic_id)),
+            return_exceptions=True
+        )
+        
+        if isinstance(linked, Exception):
+            # Без topic_id ответы администраторов не дойдут - откатываем тикет целиком
+            logger.error("Failed to link topic %s to ticket %s: %s", topic_id, ticket.ticket_id, linked)
+            try:
+                await bot.delete_forum_topic(chat_id=int(ADMIN_GROUP_ID), message_thread_id=topic_id)
+            except Exception as e:
+                logger.error("Failed to delete forum topic %s: %s", topic_id, e)
+            await service.delete_ticket(ticket)
+            await notify("❌ Не удалось создать обращение. Попробуйте позже.")
+            return
+        
+        logger.info("Created topic %s for ticket %s", topic_id, ticket.ticket_id)
+        
+        if isinstance(relayed, Exception):
+            await notify("⚠️ Обращение создано, но сообщение не доставлено. Пожалуйста, отправьте его ещё раз.")
+        
+    finally:
+        if ack is not None:
+            results = await asyncio.gather(ack, return_exceptions=True)
+            if isinstance(results[0], Exception):
+                logger.error("Failed to acknowledge ticket: %s", results[0])
+        stats.observe_latency("new_ticket", time.perf_counter() - started_at)
+
+
+async def timed(stage: str, awaitable: Awaitable[T]) -> T:
+    """Выполняет этап и записывает его задержку в статистику"""
+    started_at = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        stats.observe_latency(stage, time.perf_counter() - started_at)
+
+
+async def send_and_pin_profile_info(bot: Bot, ticket: Ticket, topic_id: int):
+    """Отправляет информацию о профиле пользователя в топик и закрепляет её"""
+    profile_info = await send_user_profile_info(bot, ticket, topic_id)
+    if not profile_info:
+        return
+    
+    try:
+        # В aiogram 3.x pin_chat_message не поддерживает message_thread_id напрямую
+        # Используем прямой вызов API
+        from aiogram.methods import PinChatMessage
+        
+        await timed("pin", bot(PinChatMessage(
+            chat_id=int(ADMIN_GROUP_ID),
+            message_id=profile_info.message_id,
+            message_thread_id=topic_id
+        )))
+        logger.info("Pinned profile info message in topic %s", topic_id)
+    except Exception as e:
+        logger.warning("Failed to pin message (may not be supported): %s", e)
+
+
 async def send_user_profile_info(bot: Bot, ticket: Ticket, topic_id: int) -> Message | None:
     """Отправляет информацию о профиле пользователя в топик"""
     try:
@@ -220,7 +314,7 @@ async def send_user_profile_info(bot: Bot, ticket: Ticket, topic_id: int) -> Mes
         return msg
         
     except Exception as e:
-        logger.error(f"Failed to send user profile info: {e}", exc_info=True)
+        logger.error("Failed to send user profile info: %s", e, exc_info=True)
         return None
 
 
@@ -233,22 +327,24 @@ async def send_message_to_topic_safe(bot: Bot, message: Message, topic_id: int):
     
     for attempt in range(max_retries):
         try:
-            await send_message_to_topic(bot, message, topic_id)
+            relayed = await send_message_to_topic(bot, message, topic_id)
+            stats.message_from_user()
+            flood_filter.track_relay(bot, message, relayed)
             return
         except TelegramRetryAfter as e:
             wait_time = e.retry_after
-            logger.warning(f"Flood control: waiting {wait_time} seconds (attempt {attempt + 1}/{max_retries})")
+            logger.warning("Flood control: waiting %s seconds (attempt %s/%s)", wait_time, attempt + 1, max_retries)
             await asyncio.sleep(wait_time)
         except Exception as e:
-            logger.error(f"Failed to send message to topic {topic_id}: {e}", exc_info=True)
+            logger.error("Failed to send message to topic %s: %s", topic_id, e, exc_info=True)
             if attempt < max_retries - 1:
                 await asyncio.sleep(retry_delay)
             else:
                 raise
 
 
-async def send_message_to_topic(bot: Bot, message: Message, topic_id: int):
-    """Отправляет сообщение в топик админ-группы"""
+async def send_message_to_topic(bot: Bot, message: Message, topic_id: int) -> Message:
+    """Отправляет сообщение в топик админ-группы и возвращает отправленное"""
     try:
         from config import ADMIN_GROUP_ID
         from aiogram.enums import ContentType
@@ -257,74 +353,74 @@ async def send_message_to_topic(bot: Bot, message: Message, topic_id: int):
         await asyncio.sleep(0.1)
         
         if message.content_type == ContentType.TEXT:
-            await bot.send_message(
+            return await bot.send_message(
                 ADMIN_GROUP_ID,
                 message.text,
                 message_thread_id=topic_id
             )
         elif message.content_type == ContentType.PHOTO:
-            await bot.send_photo(
+            return await bot.send_photo(
                 ADMIN_GROUP_ID,
                 message.photo[-1].file_id,
                 caption=message.caption,
                 message_thread_id=topic_id
             )
         elif message.content_type == ContentType.VIDEO:
-            await bot.send_video(
+            return await bot.send_video(
                 ADMIN_GROUP_ID,
                 message.video.file_id,
                 caption=message.caption,
                 message_thread_id=topic_id
             )
         elif message.content_type == ContentType.DOCUMENT:
-            await bot.send_document(
+            return await bot.send_document(
                 ADMIN_GROUP_ID,
                 message.document.file_id,
                 caption=message.caption,
                 message_thread_id=topic_id
             )
         elif message.content_type == ContentType.VOICE:
-            await bot.send_voice(
+            return await bot.send_voice(
                 ADMIN_GROUP_ID,
                 message.voice.file_id,
                 caption=message.caption,
                 message_thread_id=topic_id
             )
         elif message.content_type == ContentType.AUDIO:
-            await bot.send_audio(
+            return await bot.send_audio(
                 ADMIN_GROUP_ID,
                 message.audio.file_id,
                 caption=message.caption,
                 message_thread_id=topic_id
             )
         elif message.content_type == ContentType.VIDEO_NOTE:
-            await bot.send_video_note(
+            return await bot.send_video_note(
                 ADMIN_GROUP_ID,
                 message.video_note.file_id,
                 message_thread_id=topic_id
             )
         elif message.content_type == ContentType.STICKER:
-            await bot.send_sticker(
+            return await bot.send_sticker(
                 ADMIN_GROUP_ID,
                 message.sticker.file_id,
                 message_thread_id=topic_id
             )
         elif message.content_type == ContentType.ANIMATION:
-            await bot.send_animation(
+            return await bot.send_animation(
                 ADMIN_GROUP_ID,
                 message.animation.file_id,
                 caption=message.caption,
                 message_thread_id=topic_id
             )
         else:
-            await bot.send_message(
+            return await bot.send_message(
                 ADMIN_GROUP_ID,
                 f"[Неподдерживаемый тип: {message.content_type}]",
                 message_thread_id=topic_id
             )
             
     except Exception as e:
-        logger.error(f"Failed to send message to topic {topic_id}: {e}", exc_info=True)
+        logger.error("Failed to send message to topic %s: %s", topic_id, e, exc_info=True)
         raise
 
 
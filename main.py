@@ -8,18 +8,52 @@ import sys
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN, ADMIN_GROUP_ID, ADMIN_IDS
+from config import (
+    BOT_TOKEN,
+    ADMIN_GROUP_ID,
+    ADMIN_IDS,
+    SNAPSHOT_PATH,
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_INFO_SAMPLE_RATE,
+    LOG_ERROR_BURST,
+    HTTP_LIGHT_POOL_SIZE,
+    HTTP_HEAVY_POOL_SIZE,
+    HTTP_KEEPALIVE,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_LIGHT_TIMEOUT,
+    HTTP_HEAVY_TIMEOUT,
+    HTTP_METHOD_TIMEOUTS,
+    HTTP_FAST_JSON,
+)
 from database import get_db
-from handlers import user_router, admin_router
+from handlers import user_router, admin_router, bulk_router, broadcast_router, stats_router
+from handlers.broadcast_handlers import resume_broadcasts
+from handlers.bulk_handlers import resume_bulk_jobs
+from services import stats, ticket_cache
+from utils import (
+    LogContextMiddleware,
+    TunedAiohttpSession,
+    admission,
+    idempotency,
+    load_snapshot,
+    rate_limiter,
+    save_snapshot,
+    setup_logging,
+    traffic_recorder,
+)
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)]
+# Вывод логов идёт из фонового потока, чтобы запись в stdout не блокировала event loop
+log_listener = setup_logging(
+    level=LOG_LEVEL,
+    json_format=LOG_FORMAT == "json",
+    info_sample_rate=LOG_INFO_SAMPLE_RATE,
+    error_burst=LOG_ERROR_BURST
 )
 logger = logging.getLogger(__name__)
 
@@ -31,54 +65,131 @@ async def on_startup(bot: Bot):
     await db.init_db()
     logger.info("База данных инициализирована")
     
+    await idempotency.load()
+    idempotency.start()
+    
+    # Восстанавливаем состояние, сохранённое при остановке
+    snapshot = load_snapshot(SNAPSHOT_PATH)
+    if snapshot:
+        rate_limiter.restore(snapshot.limiter_entries())
+        ticket_cache.fallback = snapshot
+        logger.info("Snapshot loaded: %s tickets, %s rate-limited users", snapshot.tickets_count, snapshot.limiter_count)
+    
+    await stats.load()
+    stats.start()
+    
+    traffic_recorder.start()
+    
+    # Продолжаем пакетные операции и рассылки, прерванные перезапуском
+    await resume_bulk_jobs(bot)
+    await resume_broadcasts(bot)
+    
     bot_info = await bot.get_me()
-    logger.info(f"Бот запущен: @{bot_info.username}")
-    logger.info(f"ADMIN_GROUP_ID: {ADMIN_GROUP_ID}")
-    logger.info(f"ADMIN_IDS: {ADMIN_IDS}")
+    logger.info("Бот запущен: @%s", bot_info.username)
+    logger.info("ADMIN_GROUP_ID: %s", ADMIN_GROUP_ID)
+    logger.info("ADMIN_IDS: %s", ADMIN_IDS)
     
     # Проверяем доступ к админ-группе
     if ADMIN_GROUP_ID:
         try:
             chat = await bot.get_chat(ADMIN_GROUP_ID)
-            logger.info(f"Admin group: {chat.title} (ID: {chat.id})")
+            logger.info("Admin group: %s (ID: %s)", chat.title, chat.id)
         except Exception as e:
-            logger.error(f"Cannot access admin group: {e}")
+            logger.error("Cannot access admin group: %s", e)
 
 
 async def on_shutdown(bot: Bot):
     """Действия при остановке"""
     logger.info("Остановка бота...")
+    try:
+        save_snapshot(SNAPSHOT_PATH, rate_limiter, ticket_cache)
+    except Exception as e:
+        logger.error("Failed to save snapshot: %s", e)
+    
+    try:
+        await stats.stop()
+    except Exception as e:
+        logger.error("Failed to save stats: %s", e)
+    
+    try:
+        await idempotency.stop()
+    except Exception as e:
+        logger.error("Failed to save update watermark: %s", e)
+    
+    try:
+        await traffic_recorder.stop()
+    except Exception as e:
+        logger.error("Failed to write traffic log: %s", e)
+    
     db = get_db()
     await db.close()
     logger.info("Бот остановлен")
 
 
-async def main():
-    """Главная функция"""
-    
-    if not BOT_TOKEN:
-        logger.error("BOT_TOKEN не установлен! Создайте файл .env с токеном бота.")
-        sys.exit(1)
-    
-    if not ADMIN_GROUP_ID:
-        logger.error("ADMIN_GROUP_ID не установлен! Укажите ID админ-группы в .env")
-        sys.exit(1)
+def create_bot(api: TelegramAPIServer = PRODUCTION) -> Bot:
+    """Создаёт бота (api - адрес Bot API, replay.py подставляет локальный)"""
+    # Отдельные пулы соединений для медиа и лёгких запросов
+    session = TunedAiohttpSession(
+        api=api,
+        light_limit=HTTP_LIGHT_POOL_SIZE,
+        heavy_limit=HTTP_HEAVY_POOL_SIZE,
+        keepalive_timeout=HTTP_KEEPALIVE,
+        dns_cache_ttl=HTTP_DNS_CACHE_TTL,
+        light_timeout=HTTP_LIGHT_TIMEOUT,
+        heavy_timeout=HTTP_HEAVY_TIMEOUT,
+        method_timeouts=HTTP_METHOD_TIMEOUTS,
+        fast_json=HTTP_FAST_JSON
+    )
+    if traffic_recorder.enabled:
+        session.middleware(traffic_recorder.api_middleware)
     
-    bot = Bot(
+    return Bot(
         token=BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    
+
+
+def create_dispatcher() -> Dispatcher:
+    """Создаёт диспетчер с middleware и роутерами"""
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
+    # Запись трафика видит апдейты в том виде, в каком их прислал Telegram
+    if traffic_recorder.enabled:
+        dp.update.outer_middleware(traffic_recorder)
+    # Повторно доставленные апдейты отбрасываются до любых обработчиков
+    dp.update.outer_middleware(idempotency)
+    dp.update.outer_middleware(LogContextMiddleware())
+    # Ограничение нагрузки с приоритетом админов и открытых тикетов
+    dp.update.outer_middleware(admission)
+    
     # Регистрация роутеров
-    # Порядок важен: сначала админы, потом пользователи
+    # Порядок важен: сначала команды админов, потом админы, потом пользователи
+    dp.include_router(bulk_router)
+    dp.include_router(broadcast_router)
+    dp.include_router(stats_router)
     dp.include_router(admin_router)
     dp.include_router(user_router)
     
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
+    return dp
+
+
+async def main():
+    """Главная функция"""
+    
+    if not BOT_TOKEN:
+        logger.error("BOT_TOKEN не установлен! Создайте файл .env с токеном бота.")
+        sys.exit(1)
+    
+    if not ADMIN_GROUP_ID:
+        logger.error("ADMIN_GROUP_ID не установлен! Укажите ID админ-группы в .env")
+        sys.exit(1)
+    
+    bot = create_bot()
+    dp = create_dispatcher()
     
     logger.info("Запуск бота...")
     try:
@@ -92,3 +203,5 @@ if __name__ == "__main__":
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
+    finally:
+        log_listener.stop()
@@ -0,0 +1,222 @@
+"""
+Воспроизведение записанного трафика (RECORD_PATH) через диспетчер бота
+
+Апдейты из журнала подаются в тот же Dispatcher, что и в main.py, с исходными
+интервалами (или ускоренно). Бот работает с локальной заглушкой Bot API и
+отдельной базой данных. В конце выводится сводка задержек обработки, чтобы
+сравнивать изменения производительности на реальной форме трафика.
+
+    python replay.py data/traffic.jsonl.gz --speed 10
+    python replay.py data/traffic.jsonl.gz --speed 0 --emulate-latency
+"""
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import statistics
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+REPLAY_TOKEN = "123456:replay"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Replay", "username": "replay_bot"}
+
+
+def read_log(path: str) -> List[Dict[str, Any]]:
+    """Читает журнал (gzip из нескольких блоков, JSON-запись на строку)"""
+    records = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class MockBotAPI:
+    """
+    Локальная заглушка Bot API
+
+    Отвечает правдоподобными объектами на методы, которые вызывает бот.
+    С latencies каждый ответ задерживается на медиану записанной длительности метода.
+    """
+
+    def __init__(self, latencies: Optional[Dict[str, float]] = None):
+        self.latencies = latencies or {}
+        self.calls: Counter = Counter()
+        self.message_ids = itertools.count(1)
+        self.topic_ids = itertools.count(1000)
+        self.runner: Optional[web.AppRunner] = None
+
+    async def start(self, port: int) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] += 1
+
+        delay = self.latencies.get(method)
+        if delay:
+            await asyncio.sleep(delay)
+        return web.json_response({"ok": True, "result": self.result(method, params)})
+
+    def result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == "getMe":
+            return BOT_USER
+        if method == "getChat":
+            return {"id": int(params["chat_id"]), "type": "supergroup", "title": "Replay", "is_forum": True}
+        if method == "createForumTopic":
+            return {"message_thread_id": next(self.topic_ids), "name": params.get("name", ""), "icon_color": 7322096}
+        if method == "copyMessage":
+            return {"message_id": next(self.message_ids)}
+        if method == "sendMediaGroup":
+            return [self.message(params)]
+        if method.startswith("send") or method in ("forwardMessage", "editMessageText", "editMessageCaption"):
+            return self.message(params)
+        return True
+
+    def message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params.get("chat_id") or 0)
+        message: Dict[str, Any] = {
+            "message_id": int(params.get("message_id") or next(self.message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+        }
+        if params.get("message_thread_id"):
+            message["message_thread_id"] = int(params["message_thread_id"])
+        if "text" in params:
+            message["text"] = params["text"]
+        return message
+
+
+def prepare_environment(args: argparse.Namespace, meta: Dict[str, Any]):
+    """Конфигурация читается при импорте, поэтому окружение готовится до импорта main"""
+    os.environ["BOT_TOKEN"] = REPLAY_TOKEN
+    os.environ["ADMIN_GROUP_ID"] = str(meta.get("admin_group_id") or "")
+    os.environ["ADMIN_IDS"] = ",".join(str(admin_id) for admin_id in meta.get("admin_ids", []))
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{args.db}"
+    os.environ["SNAPSHOT_PATH"] = f"{args.db}.snapshot"
+    os.environ["RECORD_PATH"] = ""
+    os.environ["LOG_LEVEL"] = "INFO" if args.verbose else "WARNING"
+
+    # Каждое воспроизведение начинается с пустой базы
+    for path in (args.db, f"{args.db}-wal", f"{args.db}-shm", f"{args.db}.snapshot"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def replay(args: argparse.Namespace, records: List[Dict[str, Any]]):
+    from aiogram.client.telegram import TelegramAPIServer
+
+    import main
+
+    updates = sorted((r for r in records if r["type"] == "update"), key=lambda r: r["ts"])
+    recorded_api: Dict[str, List[float]] = defaultdict(list)
+    for record in records:
+        if record["type"] == "api":
+            recorded_api[record["method"]].append(record["duration"])
+
+    latencies = {method: statistics.median(values) for method, values in recorded_api.items()}
+    api = MockBotAPI(latencies if args.emulate_latency else None)
+    base_url = await api.start(args.port)
+
+    bot = main.create_bot(api=TelegramAPIServer.from_base(base_url))
+    dp = main.create_dispatcher()
+
+    handled: List[float] = []
+    errors = 0
+
+    async def feed(update: Dict[str, Any]):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception:
+            errors += 1
+        handled.append(time.perf_counter() - started)
+
+    tasks = set()
+    try:
+        await dp.emit_startup(bot=bot)
+        started = time.perf_counter()
+        previous_ts = updates[0]["ts"] if updates else 0.0
+
+        for record in updates:
+            # Паузы между сеансами записи (перезапуски, простой) ограничиваются max_gap
+            gap = min(record["ts"] - previous_ts, args.max_gap)
+            previous_ts = record["ts"]
+            if args.speed > 0 and gap > 0:
+                await asyncio.sleep(gap / args.speed)
+
+            if args.sequential:
+                await feed(record["update"])
+            else:
+                task = asyncio.create_task(feed(record["update"]))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        await dp.emit_shutdown(bot=bot)
+    finally:
+        await bot.session.close()
+        await api.stop()
+        main.log_listener.stop()
+
+    recorded = [r["duration"] for r in updates]
+    print(f"Updates: {len(handled)} in {elapsed:.2f} s ({len(handled) / elapsed if elapsed else 0:.1f}/s), errors: {errors}")
+    print(f"{'':10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for name, values in (("recorded", recorded), ("replay", handled)):
+        print(
+            f"{name:10}"
+            + "".join(f"{percentile(values, q) * 1000:>8.1f}ms" for q in (0.5, 0.9, 0.99))
+            + f"{max(values, default=0) * 1000:>8.1f}ms"
+        )
+    print("API calls (recorded -> replay):")
+    for method in sorted(set(recorded_api) | set(api.calls)):
+        print(f"  {method}: {len(recorded_api.get(method, []))} -> {api.calls[method]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика бота")
+    parser.add_argument("log", help="журнал, записанный с RECORD_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение (1 - исходная скорость, 0 - без пауз)")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="максимальная пауза между апдейтами, с")
+    parser.add_argument("--sequential", action="store_true", help="обрабатывать апдейты строго по одному")
+    parser.add_argument("--emulate-latency", action="store_true", help="задерживать ответы Bot API на записанную медиану")
+    parser.add_argument("--db", default="replay.db", help="файл SQLite для воспроизведения (пересоздаётся)")
+    parser.add_argument("--port", type=int, default=8081, help="порт заглушки Bot API")
+    parser.add_argument("--verbose", action="store_true", help="логи бота уровня INFO")
+    args = parser.parse_args()
+
+    records = read_log(args.log)
+    meta = next((r for r in reversed(records) if r["type"] == "meta"), {})
+    prepare_environment(args, meta)
+    asyncio.run(replay(args, records))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,14 @@
 from services.ticket_service import TicketService
+from services.broadcast_service import BroadcastService
+from services.stats_service import StatsCollector, stats
+from services.ticket_cache import CachedTicket, TicketCache, ticket_cache
 
-__all__ = ["TicketService"]
+__all__ = [
+    "TicketService",
+    "BroadcastService",
+    "StatsCollector",
+    "stats",
+    "CachedTicket",
+    "TicketCache",
+    "ticket_cache",
+]
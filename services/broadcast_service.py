@@ -0,0 +1,114 @@
+"""
+Сервис для рассылок
+"""
+from datetime import datetime
+from typing import AsyncIterator, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Broadcast, BroadcastDelivery, JobStatus, Ticket
+
+# Сколько строк курсор забирает из БД за раз
+STREAM_BATCH_SIZE = 500
+
+
+class BroadcastService:
+    """Сервис для работы с рассылками"""
+    
+    def __init__(self, session: AsyncSession):
+        self.session = session
+    
+    async def create_broadcast(
+        self,
+        admin_id: int,
+        text: Optional[str] = None,
+        source_message_id: Optional[int] = None
+    ) -> Broadcast:
+        """Создать рассылку"""
+        total = await self.session.scalar(
+            select(func.count(func.distinct(Ticket.user_chat_id)))
+        )
+        broadcast = Broadcast(
+            admin_id=admin_id,
+            text=text,
+            source_message_id=source_message_id,
+            status=JobStatus.RUNNING,
+            total=total or 0,
+            sent=0,
+            failed=0
+        )
+        self.session.add(broadcast)
+        await self.session.commit()
+        await self.session.refresh(broadcast)
+        return broadcast
+    
+    async def get_unfinished_broadcasts(self) -> list[Broadcast]:
+        """Получить незавершённые рассылки"""
+        result = await self.session.execute(
+            select(Broadcast)
+            .where(Broadcast.status == JobStatus.RUNNING)
+            .order_by(Broadcast.id)
+        )
+        return list(result.scalars().all())
+    
+    async def stream_pending_chat_ids(self, broadcast_id: int) -> AsyncIterator[int]:
+        """
+        Потоково выдаёт chat_id получателей, которым рассылка ещё не отправлялась
+        
+        Выборка идёт через серверный курсор, поэтому список получателей
+        не загружается в память целиком.
+        """
+        already_sent = (
+            select(BroadcastDelivery.id)
+            .where(
+                BroadcastDelivery.broadcast_id == broadcast_id,
+                BroadcastDelivery.chat_id == Ticket.user_chat_id
+            )
+            .exists()
+        )
+        result = await self.session.stream_scalars(
+            select(Ticket.user_chat_id)
+            .where(~already_sent)
+            .distinct()
+            .order_by(Ticket.user_chat_id)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        async for chat_id in result:
+            yield chat_id
+    
+    async def save_deliveries(
+        self,
+        broadcast: Broadcast,
+        deliveries: Sequence[tuple[int, bool, Optional[str]]]
+    ) -> Broadcast:
+        """Сохранить результаты доставки: (chat_id, delivered, error)"""
+        self.session.add_all([
+            BroadcastDelivery(
+                broadcast_id=broadcast.id,
+                chat_id=chat_id,
+                delivered=delivered,
+                error=error[:255] if error else None
+            )
+            for chat_id, delivered, error in deliveries
+        ])
+        sent = sum(1 for _, delivered, _ in deliveries if delivered)
+        broadcast.sent += sent
+        broadcast.failed += len(deliveries) - sent
+        await self.session.commit()
+        return broadcast
+    
+    async def update_broadcast(
+        self,
+        broadcast: Broadcast,
+        progress_message_id: Optional[int] = None,
+        finished: bool = False
+    ) -> Broadcast:
+        """Сохранить состояние рассылки"""
+        if progress_message_id is not None:
+            broadcast.progress_message_id = progress_message_id
+        if finished:
+            broadcast.status = JobStatus.DONE
+            broadcast.finished_at = datetime.utcnow()
+        await self.session.commit()
+        return broadcast
@@ -0,0 +1,299 @@
+"""
+Статистика поддержки
+Счётчики обновляются инкрементально при изменении тикетов и пересылке сообщений,
+поэтому запрос статистики не зависит от количества тикетов в БД
+"""
+import asyncio
+import json
+import logging
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select
+
+from database import get_db
+from database.models import BotState, StatsRollup, Ticket, TicketStatus
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм времени (секунды): 1м, 5м, 15м, 30м, 1ч, 2ч, 4ч, 8ч, 1д, 2д, 7д
+HISTOGRAM_BOUNDS = [60, 300, 900, 1800, 3600, 7200, 14400, 28800, 86400, 172800, 604800]
+
+# Границы корзин гистограмм задержек этапов обработки (миллисекунды)
+LATENCY_BOUNDS_MS = [50, 100, 250, 500, 1000, 2000, 5000, 10000]
+
+# Как часто сохранять статистику в БД (секунды)
+FLUSH_INTERVAL = 60
+
+AWAITING_STATE_KEY = "stats.awaiting_response"
+
+
+class Histogram:
+    """Гистограмма времени с фиксированными корзинами"""
+
+    def __init__(self, counts: Optional[Iterable[int]] = None, bounds: list[int] = HISTOGRAM_BOUNDS):
+        self.bounds = bounds
+        self.counts = list(counts or []) or [0] * (len(bounds) + 1)
+
+    def observe(self, value: float):
+        """Добавить значение"""
+        self.counts[bisect_left(self.bounds, value)] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def percentile(self, q: float) -> Optional[int]:
+        """
+        Оценка перцентиля - верхняя граница корзины, в которую он попадает
+
+        Returns:
+            Граница корзины или None, если значений нет (-1 для последней корзины без границы)
+        """
+        total = self.total
+        if not total:
+            return None
+
+        threshold = q * total
+        cumulative = 0
+        for bound, count in zip(self.bounds + [-1], self.counts):
+            cumulative += count
+            if cumulative >= threshold:
+                return bound
+        return -1
+
+
+@dataclass
+class Rollup:
+    """Счётчики за час или день"""
+    period: str
+    bucket_start: datetime
+    tickets_created: int = 0
+    tickets_closed: int = 0
+    tickets_reopened: int = 0
+    messages_from_users: int = 0
+    messages_from_admins: int = 0
+    first_response: Histogram = field(default_factory=Histogram)
+    resolution: Histogram = field(default_factory=Histogram)
+
+
+def bucket_start(period: str, now: datetime) -> datetime:
+    """Начало часа или дня, в который попадает now"""
+    if period == "hour":
+        return now.replace(minute=0, second=0, microsecond=0)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class StatsCollector:
+    """Сборщик статистики поддержки"""
+
+    PERIODS = ("hour", "day")
+
+    def __init__(self):
+        self.open_tickets = 0
+        # Ticket.id -> время (unix) открытия тикета, ещё не получившего ответа.
+        # Порядок вставки совпадает с порядком открытия, первый элемент - самый старый
+        self.awaiting_response: dict[int, float] = {}
+        self.rollups: dict[tuple[str, datetime], Rollup] = {}
+        self.dirty: set[tuple[str, datetime]] = set()
+        # Задержки этапов обработки с момента запуска (в БД не сохраняются)
+        self.latency: dict[str, Histogram] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def rollup(self, period: str) -> Rollup:
+        """Текущий rollup за час или день"""
+        key = (period, bucket_start(period, datetime.utcnow()))
+        rollup = self.rollups.get(key)
+        if rollup is None:
+            rollup = self.rollups[key] = Rollup(*key)
+        return rollup
+
+    def _touch(self) -> list[Rollup]:
+        """Текущие rollup'ы, помеченные для сохранения"""
+        rollups = [self.rollup(period) for period in self.PERIODS]
+        for rollup in rollups:
+            self.dirty.add((rollup.period, rollup.bucket_start))
+        return rollups
+
+    # ---------- События ----------
+
+    def ticket_created(self, ticket_pk: int):
+        """Создан новый тикет"""
+        self.open_tickets += 1
+        self.awaiting_response[ticket_pk] = time.time()
+        for rollup in self._touch():
+            rollup.tickets_created += 1
+
+    def ticket_reopened(self, ticket_pk: int):
+        """Тикет переоткрыт сообщением пользователя"""
+        self.open_tickets += 1
+        self.awaiting_response[ticket_pk] = time.time()
+        for rollup in self._touch():
+            rollup.tickets_reopened += 1
+
+    def ticket_closed(self, ticket_pk: int, created_at: Optional[datetime]):
+        """Тикет закрыт"""
+        self.open_tickets = max(self.open_tickets - 1, 0)
+        self.awaiting_response.pop(ticket_pk, None)
+        resolution = (datetime.utcnow() - created_at).total_seconds() if created_at else None
+        for rollup in self._touch():
+            rollup.tickets_closed += 1
+            if resolution is not None:
+                rollup.resolution.observe(resolution)
+
+    def ticket_discarded(self, ticket_pk: int):
+        """Создание тикета отменено (не удалось создать топик)"""
+        self.open_tickets = max(self.open_tickets - 1, 0)
+        self.awaiting_response.pop(ticket_pk, None)
+        for rollup in self._touch():
+            rollup.tickets_created = max(rollup.tickets_created - 1, 0)
+
+    def tickets_bulk_changed(self, ticket_pks: list[int], status: TicketStatus):
+        """
+        Статус изменён пакетной операцией
+
+        Массовое закрытие не учитывается во времени решения, иначе
+        закрытие старых тикетов после инцидента исказит гистограмму.
+        """
+        count = len(ticket_pks)
+        if status == TicketStatus.CLOSED:
+            self.open_tickets = max(self.open_tickets - count, 0)
+            for pk in ticket_pks:
+                self.awaiting_response.pop(pk, None)
+            for rollup in self._touch():
+                rollup.tickets_closed += count
+        else:
+            self.open_tickets += count
+            for rollup in self._touch():
+                rollup.tickets_reopened += count
+
+    def message_from_user(self):
+        """Сообщение пользователя переслано в топик"""
+        for rollup in self._touch():
+            rollup.messages_from_users += 1
+
+    def message_from_admin(self, ticket_pk: int):
+        """Ответ администратора переслан пользователю"""
+        opened_at = self.awaiting_response.pop(ticket_pk, None)
+        for rollup in self._touch():
+            rollup.messages_from_admins += 1
+            if opened_at is not None:
+                rollup.first_response.observe(time.time() - opened_at)
+
+    def observe_latency(self, stage: str, seconds: float):
+        """Задержка этапа обработки"""
+        histogram = self.latency.get(stage)
+        if histogram is None:
+            histogram = self.latency[stage] = Histogram(bounds=LATENCY_BOUNDS_MS)
+        histogram.observe(seconds * 1000)
+
+    def oldest_awaiting(self) -> Optional[float]:
+        """Сколько секунд ждёт ответа самый старый тикет"""
+        if not self.awaiting_response:
+            return None
+        return time.time() - next(iter(self.awaiting_response.values()))
+
+    # ---------- Хранение ----------
+
+    async def load(self):
+        """Загрузить состояние при запуске"""
+        async with get_db().session_factory() as session:
+            self.open_tickets = await session.scalar(
+                select(func.count(Ticket.id)).where(Ticket.status == TicketStatus.OPEN)
+            ) or 0
+
+            now = datetime.utcnow()
+            for period in self.PERIODS:
+                start = bucket_start(period, now)
+                row = await session.scalar(
+                    select(StatsRollup).where(
+                        StatsRollup.period == period,
+                        StatsRollup.bucket_start == start
+                    )
+                )
+                if row:
+                    self.rollups[(period, start)] = Rollup(
+                        period=period,
+                        bucket_start=start,
+                        tickets_created=row.tickets_created,
+                        tickets_closed=row.tickets_closed,
+                        tickets_reopened=row.tickets_reopened,
+                        messages_from_users=row.messages_from_users,
+                        messages_from_admins=row.messages_from_admins,
+                        first_response=Histogram(json.loads(row.first_response_hist)),
+                        resolution=Histogram(json.loads(row.resolution_hist))
+                    )
+
+            state = await session.get(BotState, AWAITING_STATE_KEY)
+            if state:
+                awaiting = json.loads(state.value)
+                self.awaiting_response = {
+                    int(pk): opened_at
+                    for pk, opened_at in sorted(awaiting.items(), key=lambda item: item[1])
+                }
+
+    async def flush(self):
+        """Сохранить изменённые rollup'ы и очередь ожидающих ответа"""
+        keys, self.dirty = self.dirty, set()
+        try:
+            async with get_db().session_factory() as session:
+                for period, start in keys:
+                    rollup = self.rollups[(period, start)]
+                    row = await session.scalar(
+                        select(StatsRollup).where(
+                            StatsRollup.period == period,
+                            StatsRollup.bucket_start == start
+                        )
+                    )
+                    if row is None:
+                        row = StatsRollup(period=period, bucket_start=start)
+                        session.add(row)
+                    row.tickets_created = rollup.tickets_created
+                    row.tickets_closed = rollup.tickets_closed
+                    row.tickets_reopened = rollup.tickets_reopened
+                    row.messages_from_users = rollup.messages_from_users
+                    row.messages_from_admins = rollup.messages_from_admins
+                    row.first_response_hist = json.dumps(rollup.first_response.counts)
+                    row.resolution_hist = json.dumps(rollup.resolution.counts)
+
+                await session.merge(BotState(
+                    key=AWAITING_STATE_KEY,
+                    value=json.dumps(self.awaiting_response)
+                ))
+                await session.commit()
+        except Exception:
+            self.dirty |= keys
+            raise
+
+        # Прошедшие часы и дни больше не меняются и не нужны в памяти
+        current = {(period, bucket_start(period, datetime.utcnow())) for period in self.PERIODS}
+        for key in list(self.rollups):
+            if key not in current and key not in self.dirty:
+                del self.rollups[key]
+
+    def start(self):
+        """Запустить периодическое сохранение"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Остановить периодическое сохранение и сохранить остаток"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Failed to flush stats: %s", e, exc_info=True)
+
+
+# Глобальный экземпляр
+stats = StatsCollector()
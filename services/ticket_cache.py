@@ -0,0 +1,130 @@
+"""
+Кэш тикетов для маршрутизации сообщений без запросов к БД
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional, Protocol
+
+from database.models import Ticket, TicketStatus
+
+
+@dataclass(slots=True)
+class CachedTicket:
+    """Поля тикета, нужные для пересылки сообщений"""
+    pk: int
+    ticket_id: str
+    user_id: int
+    user_chat_id: int
+    topic_id: Optional[int]
+    is_open: bool
+
+    @classmethod
+    def from_ticket(cls, ticket: Ticket) -> "CachedTicket":
+        return cls(
+            pk=ticket.id,
+            ticket_id=ticket.ticket_id,
+            user_id=ticket.user_id,
+            user_chat_id=ticket.user_chat_id,
+            topic_id=ticket.topic_id,
+            is_open=ticket.status == TicketStatus.OPEN
+        )
+
+
+class TicketLookup(Protocol):
+    """Источник записей для промахов кэша (снимок состояния)"""
+
+    def find_by_user(self, user_id: int) -> Optional[CachedTicket]: ...
+
+    def find_by_topic(self, topic_id: int) -> Optional[CachedTicket]: ...
+
+
+class TicketCache:
+    """
+    LRU-кэш последнего тикета каждого пользователя
+
+    Обновляется TicketService при каждом изменении тикета. При промахе
+    может обращаться к снимку, загруженному при запуске (fallback).
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self.by_user: OrderedDict[int, CachedTicket] = OrderedDict()
+        self.topic_to_user: dict[int, int] = {}
+        self.fallback: Optional[TicketLookup] = None
+        # Пользователи, чьи тикеты менялись после загрузки снимка
+        self.shadowed: set[int] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get_by_user(self, user_id: int) -> Optional[CachedTicket]:
+        """Последний тикет пользователя"""
+        entry = self.by_user.get(user_id)
+        if entry is None and self.fallback is not None and user_id not in self.shadowed:
+            entry = self.fallback.find_by_user(user_id)
+            if entry is not None:
+                self._store(entry)
+        return self._count(entry)
+
+    def get_by_topic(self, topic_id: int) -> Optional[CachedTicket]:
+        """Тикет по топику"""
+        user_id = self.topic_to_user.get(topic_id)
+        entry = self.by_user.get(user_id) if user_id is not None else None
+        if entry is None and self.fallback is not None:
+            candidate = self.fallback.find_by_topic(topic_id)
+            # Запись в снимке устарела, если тикеты пользователя менялись после запуска
+            if candidate is not None and candidate.user_id not in self.shadowed:
+                entry = candidate
+                self._store(entry)
+        return self._count(entry)
+
+    def put(self, ticket: Ticket):
+        """Сохранить актуальное состояние тикета"""
+        if self.fallback is not None:
+            self.shadowed.add(ticket.user_id)
+        self._store(CachedTicket.from_ticket(ticket))
+
+    def discard(self, user_id: int):
+        """Удалить тикет пользователя из кэша"""
+        if self.fallback is not None:
+            self.shadowed.add(user_id)
+        self._remove(user_id)
+
+    def discard_many(self, ticket_pks: Iterable[int]):
+        """Удалить тикеты из кэша (после пакетных операций)"""
+        pks = set(ticket_pks)
+        for user_id, entry in list(self.by_user.items()):
+            if entry.pk in pks:
+                self._remove(user_id)
+        # Снимок не знает о пакетном изменении
+        self.fallback = None
+        self.shadowed.clear()
+
+    def entries(self) -> list[CachedTicket]:
+        """Все записи кэша (от старых к новым)"""
+        return list(self.by_user.values())
+
+    def _store(self, entry: CachedTicket):
+        self._remove(entry.user_id)
+        self.by_user[entry.user_id] = entry
+        if entry.topic_id is not None:
+            self.topic_to_user[entry.topic_id] = entry.user_id
+        while len(self.by_user) > self.capacity:
+            oldest_user = next(iter(self.by_user))
+            self._remove(oldest_user)
+
+    def _remove(self, user_id: int):
+        entry = self.by_user.pop(user_id, None)
+        if entry is not None and entry.topic_id is not None:
+            self.topic_to_user.pop(entry.topic_id, None)
+
+    def _count(self, entry: Optional[CachedTicket]) -> Optional[CachedTicket]:
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.by_user.move_to_end(entry.user_id)
+        return entry
+
+
+# Глобальный экземпляр
+ticket_cache = TicketCache()
@@ -1,13 +1,17 @@
 """
 Сервис для работы с тикетами
 """
-from datetime import datetime
-from typing import Optional
+import json
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import and_, delete, exists, or_, select, update
+from sqlalchemy.orm import aliased
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import Ticket, TicketStatus
+from database.models import BulkJob, JobStatus, ProcessedMessage, Ticket, TicketStatus, TicketTag
+from services.stats_service import stats
+from services.ticket_cache import ticket_cache
 
 
 class TicketService:
@@ -27,7 +31,10 @@ class TicketService:
             .order_by(Ticket.created_at.desc(), Ticket.id.desc())
             .limit(1)
         )
-        return result.scalar_one_or_none()
+        ticket = result.scalar_one_or_none()
+        if ticket:
+            ticket_cache.put(ticket)
+        return ticket
     
     async def get_last_ticket_by_user(self, user_id: int) -> Optional[Ticket]:
         """Получить последний тикет пользователя (включая закрытые)"""
@@ -37,16 +44,26 @@ class TicketService:
             .order_by(Ticket.created_at.desc(), Ticket.id.desc())
             .limit(1)
         )
-        return result.scalar_one_or_none()
+        ticket = result.scalar_one_or_none()
+        if ticket:
+            ticket_cache.put(ticket)
+        return ticket
     
     async def create_ticket(
         self,
         user_id: int,
         user_chat_id: int,
         username: Optional[str],
-        full_name: str
+        full_name: str,
+        message_id: Optional[int] = None
     ) -> Ticket:
-        """Создать новый тикет"""
+        """
+        Создать новый тикет
+        
+        message_id - сообщение, с которого начат тикет: отметка о его обработке
+        сохраняется в той же транзакции (см. IdempotencyMiddleware.claim).
+        При повторной обработке commit падает с IntegrityError.
+        """
         ticket = Ticket(
             ticket_id=Ticket.generate_id(),
             user_id=user_id,
@@ -56,15 +73,32 @@ class TicketService:
             status=TicketStatus.OPEN
         )
         self.session.add(ticket)
+        if message_id is not None:
+            self.session.add(ProcessedMessage(chat_id=user_chat_id, message_id=message_id))
         await self.session.commit()
         await self.session.refresh(ticket)
+        ticket_cache.put(ticket)
+        stats.ticket_created(ticket.id)
         return ticket
     
+    async def delete_ticket(self, ticket: Ticket):
+        """Удалить тикет (откат создания, если не удалось создать или привязать топик)"""
+        # Атрибуты читаются до отката: rollback их сбрасывает, а ленивая
+        # загрузка в AsyncSession невозможна
+        pk, user_id = ticket.id, ticket.user_id
+        # После неудачного commit сессия требует отката
+        await self.session.rollback()
+        await self.session.execute(delete(Ticket).where(Ticket.id == pk))
+        await self.session.commit()
+        ticket_cache.discard(user_id)
+        stats.ticket_discarded(pk)
+    
     async def set_topic_id(self, ticket: Ticket, topic_id: int) -> Ticket:
         """Установить topic_id для тикета"""
         ticket.topic_id = topic_id
         await self.session.commit()
         await self.session.refresh(ticket)
+        ticket_cache.put(ticket)
         return ticket
     
     async def get_ticket_by_topic_id(self, topic_id: int) -> Optional[Ticket]:
@@ -72,7 +106,11 @@ class TicketService:
         result = await self.session.execute(
             select(Ticket).where(Ticket.topic_id == topic_id)
         )
-        return result.scalar_one_or_none()
+        ticket = result.scalar_one_or_none()
+        # Открытый тикет - последний тикет пользователя, его можно кэшировать
+        if ticket and ticket.status == TicketStatus.OPEN:
+            ticket_cache.put(ticket)
+        return ticket
     
     async def close_ticket(self, ticket: Ticket) -> Ticket:
         """Закрыть тикет"""
@@ -80,6 +118,8 @@ class TicketService:
         ticket.closed_at = datetime.utcnow()
         await self.session.commit()
         await self.session.refresh(ticket)
+        ticket_cache.put(ticket)
+        stats.ticket_closed(ticket.id, ticket.created_at)
         return ticket
     
     async def reopen_ticket(self, ticket: Ticket) -> Ticket:
@@ -88,4 +128,140 @@ class TicketService:
         ticket.closed_at = None
         await self.session.commit()
         await self.session.refresh(ticket)
+        ticket_cache.put(ticket)
+        stats.ticket_reopened(ticket.id)
         return ticket
+    
+    # ---------- Пакетные операции ----------
+    
+    async def find_ticket_ids(
+        self,
+        status: Optional[TicketStatus] = None,
+        user_id: Optional[int] = None,
+        older_than: Optional[timedelta] = None,
+        latest_per_user: bool = False
+    ) -> list[int]:
+        """
+        Получить Ticket.id всех тикетов, подходящих под фильтр
+        
+        latest_per_user - только последний тикет каждого пользователя (как в
+        handle_user_message) и только у пользователей без открытого тикета
+        """
+        query = select(Ticket.id).order_by(Ticket.id)
+        if latest_per_user:
+            other = aliased(Ticket)
+            newer = or_(
+                other.created_at > Ticket.created_at,
+                and_(other.created_at == Ticket.created_at, other.id > Ticket.id)
+            )
+            query = query.where(
+                ~exists().where(other.user_id == Ticket.user_id, newer),
+                ~exists().where(other.user_id == Ticket.user_id, other.status == TicketStatus.OPEN)
+            )
+        if status is not None:
+            query = query.where(Ticket.status == status)
+        if user_id is not None:
+            query = query.where(Ticket.user_id == user_id)
+        if older_than is not None:
+            query = query.where(Ticket.created_at < datetime.utcnow() - older_than)
+        result = await self.session.execute(query)
+        return list(result.scalars().all())
+    
+    async def bulk_set_status(
+        self,
+        status: TicketStatus,
+        admin_id: int,
+        user_id: Optional[int] = None,
+        older_than: Optional[timedelta] = None
+    ) -> Optional[BulkJob]:
+        """
+        Закрыть или переоткрыть все подходящие тикеты одной транзакцией
+        
+        Выбираются только тикеты в противоположном статусе. При переоткрытии -
+        только последний тикет пользователя, у которого нет открытого: у
+        пользователя не может быть больше одного открытого тикета. Вместе с
+        изменением статуса создаётся BulkJob для побочных эффектов в Telegram.
+        
+        Returns:
+            BulkJob или None, если под фильтр ничего не попало
+        """
+        current = TicketStatus.OPEN if status == TicketStatus.CLOSED else TicketStatus.CLOSED
+        ids = await self.find_ticket_ids(
+            status=current,
+            user_id=user_id,
+            older_than=older_than,
+            latest_per_user=status == TicketStatus.OPEN
+        )
+        if not ids:
+            return None
+        
+        await self.session.execute(
+            update(Ticket)
+            .where(Ticket.id.in_(ids), Ticket.status == current)
+            .values(
+                status=status,
+                closed_at=datetime.utcnow() if status == TicketStatus.CLOSED else None
+            )
+        )
+        job = BulkJob(
+            action="close" if status == TicketStatus.CLOSED else "reopen",
+            ticket_ids=json.dumps(ids),
+            total=len(ids),
+            position=0,
+            status=JobStatus.RUNNING,
+            admin_id=admin_id
+        )
+        self.session.add(job)
+        await self.session.commit()
+        await self.session.refresh(job)
+        ticket_cache.discard_many(ids)
+        stats.tickets_bulk_changed(ids, status)
+        return job
+    
+    async def bulk_add_tag(self, tag: str, ticket_ids: Sequence[int]) -> int:
+        """Добавить метку тикетам (уже помеченные пропускаются)"""
+        if not ticket_ids:
+            return 0
+        result = await self.session.execute(
+            select(TicketTag.ticket_pk).where(
+                TicketTag.tag == tag,
+                TicketTag.ticket_pk.in_(ticket_ids)
+            )
+        )
+        tagged = set(result.scalars().all())
+        new_tags = [TicketTag(ticket_pk=pk, tag=tag) for pk in ticket_ids if pk not in tagged]
+        self.session.add_all(new_tags)
+        await self.session.commit()
+        return len(new_tags)
+    
+    async def get_tickets_by_ids(self, ids: Sequence[int]) -> dict[int, Ticket]:
+        """Получить тикеты по списку Ticket.id"""
+        result = await self.session.execute(select(Ticket).where(Ticket.id.in_(ids)))
+        return {ticket.id: ticket for ticket in result.scalars().all()}
+    
+    async def get_unfinished_bulk_jobs(self) -> list[BulkJob]:
+        """Получить незавершённые пакетные операции"""
+        result = await self.session.execute(
+            select(BulkJob)
+            .where(BulkJob.status == JobStatus.RUNNING)
+            .order_by(BulkJob.id)
+        )
+        return list(result.scalars().all())
+    
+    async def update_bulk_job(
+        self,
+        job: BulkJob,
+        position: Optional[int] = None,
+        progress_message_id: Optional[int] = None,
+        finished: bool = False
+    ) -> BulkJob:
+        """Сохранить прогресс пакетной операции"""
+        if position is not None:
+            job.position = position
+        if progress_message_id is not None:
+            job.progress_message_id = progress_message_id
+        if finished:
+            job.status = JobStatus.DONE
+            job.finished_at = datetime.utcnow()
+        await self.session.commit()
+        return job
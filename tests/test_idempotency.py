@@ -0,0 +1,193 @@
+"""
+Тесты защиты от повторной обработки: кольцевой буфер, watermark, отметки claim()
+Запуск: python -m pytest
+"""
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import pytest
+from aiogram.types import Chat, Message, Update
+
+from database import connection
+from database.connection import Database
+from database.models import BotState
+from utils.idempotency import RESET_GAP, WATERMARK_MAX_AGE, WATERMARK_STATE_KEY, IdempotencyMiddleware, RecentKeys
+
+
+def make_message(message_id: int, chat_id: int = 42) -> Message:
+    return Message(
+        message_id=message_id,
+        date=datetime.now(),
+        chat=Chat(id=chat_id, type="private"),
+        text="hello"
+    )
+
+
+class Updates:
+    """Прогоняет апдейты через middleware; обработка завершается по команде теста"""
+
+    def __init__(self, middleware: IdempotencyMiddleware):
+        self.middleware = middleware
+        self.handled: list[int] = []
+        self.release: dict[int, asyncio.Event] = {}
+        self.tasks: dict[int, asyncio.Task] = {}
+
+    async def handler(self, event: Update, data):
+        self.handled.append(event.update_id)
+        await self.release[event.update_id].wait()
+
+    async def start(self, update_id: int, message: Message = None):
+        self.release[update_id] = asyncio.Event()
+        update = Update(update_id=update_id, message=message)
+        self.tasks[update_id] = asyncio.create_task(self.middleware(self.handler, update, {}))
+        await asyncio.sleep(0)
+
+    async def finish(self, update_id: int):
+        self.release[update_id].set()
+        await self.tasks.pop(update_id)
+
+    async def run(self, update_id: int, message: Message = None):
+        await self.start(update_id, message)
+        await self.finish(update_id)
+
+
+def test_recent_keys_evicts_oldest():
+    keys = RecentKeys(capacity=3)
+    assert all(keys.add(key) for key in (1, 2, 3))
+    assert not keys.add(2)
+
+    assert keys.add(4)
+    # 1 вытеснен и снова считается новым, остальные - повтор
+    assert keys.keys == {2, 3, 4}
+    assert keys.add(1)
+    assert not keys.add(4)
+    assert len(keys.ring) == 3
+
+
+def test_watermark_waits_for_out_of_order_updates():
+    async def scenario():
+        middleware = IdempotencyMiddleware()
+        updates = Updates(middleware)
+        for update_id in (101, 102, 103):
+            await updates.start(update_id)
+
+        # Апдейты перед 101 ещё обрабатываются - watermark не сдвигается
+        await updates.finish(103)
+        assert middleware.watermark == 100
+        await updates.finish(102)
+        assert middleware.watermark == 100
+
+        await updates.finish(101)
+        assert middleware.watermark == 103
+        assert middleware.in_flight == set()
+
+        # Пропущенный номер не держит watermark: апдейтов с ним не будет
+        await updates.start(105)
+        await updates.start(107)
+        await updates.finish(107)
+        assert middleware.watermark == 104
+        await updates.finish(105)
+        assert middleware.watermark == 107
+
+    asyncio.run(scenario())
+
+
+def test_duplicates_are_dropped():
+    async def scenario():
+        middleware = IdempotencyMiddleware()
+        updates = Updates(middleware)
+        await updates.run(10)
+        await updates.run(10)
+        # Ниже watermark, но не встречался - после перезапуска это повтор
+        middleware.watermark = 50
+        await updates.run(20)
+        # Тот же message_id в новом апдейте
+        await updates.run(51, make_message(7))
+        await updates.run(52, make_message(7))
+        await updates.run(53, make_message(7, chat_id=43))
+
+        assert updates.handled == [10, 51, 53]
+        assert middleware.dropped == 3
+
+    asyncio.run(scenario())
+
+
+def test_reset_on_new_numbering():
+    async def scenario():
+        middleware = IdempotencyMiddleware()
+        updates = Updates(middleware)
+        middleware.watermark = 5 * RESET_GAP
+        middleware.max_seen = 5 * RESET_GAP
+
+        # Чуть ниже watermark - обычный повтор
+        await updates.run(5 * RESET_GAP - 1)
+        assert updates.handled == []
+
+        # Намного ниже - Telegram начал новую нумерацию
+        await updates.start(3)
+        assert middleware.watermark == 0
+        assert updates.handled == [3]
+        await updates.finish(3)
+        assert middleware.watermark == 3
+
+        await updates.run(4)
+        assert middleware.watermark == 4
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database = Database(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(connection, "_db", database)
+    return database
+
+
+def test_watermark_round_trip(db):
+    async def scenario():
+        await db.init_db()
+        try:
+            middleware = IdempotencyMiddleware()
+            middleware.watermark = 500
+            await middleware.save()
+
+            restored = IdempotencyMiddleware()
+            await restored.load()
+            assert restored.watermark == 500
+
+            # Через неделю без апдейтов нумерация в Telegram начинается заново
+            async with db.session_factory() as session:
+                value = json.dumps({"watermark": 500, "saved_at": time.time() - WATERMARK_MAX_AGE - 60})
+                await session.merge(BotState(key=WATERMARK_STATE_KEY, value=value))
+                await session.commit()
+            expired = IdempotencyMiddleware()
+            await expired.load()
+            assert expired.watermark == 0
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_claims_are_batched(db):
+    async def scenario():
+        await db.init_db()
+        try:
+            middleware = IdempotencyMiddleware()
+            first = make_message(1)
+            results = await asyncio.gather(
+                middleware.claim(first),
+                middleware.claim(make_message(2)),
+                # Повтор внутри одной пачки
+                middleware.claim(make_message(1))
+            )
+            assert results == [True, True, False]
+
+            # Повторная доставка после перезапуска
+            assert await IdempotencyMiddleware().claim(first) is False
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,123 @@
+"""
+Тесты снимка состояния: формат файла, поиск по отображённому файлу, перенос записей
+Запуск: python -m pytest
+"""
+import os
+import time
+
+from database.models import Ticket, TicketStatus
+from services.ticket_cache import TicketCache
+from utils.rate_limiter import RateLimiter
+from utils.snapshot import load_snapshot, save_snapshot
+
+
+def make_ticket(pk: int, user_id: int, topic_id=None, status=TicketStatus.OPEN) -> Ticket:
+    return Ticket(
+        id=pk,
+        ticket_id=f"T-{pk:05d}",
+        user_id=user_id,
+        user_chat_id=user_id,
+        topic_id=topic_id,
+        status=status
+    )
+
+
+def save_and_load(tmp_path, cache: TicketCache, limiter: RateLimiter = None):
+    path = str(tmp_path / "state.snapshot")
+    save_snapshot(path, limiter or RateLimiter(), cache)
+    snapshot = load_snapshot(path)
+    # Файл удаляется сразу после отображения в память
+    assert not os.path.exists(path)
+    return snapshot
+
+
+def test_round_trip(tmp_path):
+    cache = TicketCache()
+    # Вставляем не по порядку: в файле записи сортируются по user_id и topic_id
+    for pk, user_id, topic_id in [(1, 300, 30), (2, 100, 50), (3, 200, None), (4, -5, 10)]:
+        cache.put(make_ticket(pk, user_id, topic_id))
+    cache.put(make_ticket(5, 400, 20, status=TicketStatus.CLOSED))
+
+    snapshot = save_and_load(tmp_path, cache)
+
+    assert snapshot.tickets_count == 5
+    assert snapshot.topics_count == 4
+    assert [entry.user_id for entry in snapshot.tickets()] == [-5, 100, 200, 300, 400]
+
+    for entry in cache.entries():
+        assert snapshot.find_by_user(entry.user_id) == entry
+
+    found = snapshot.find_by_topic(50)
+    assert found.user_id == 100 and found.ticket_id == "T-00002" and found.is_open
+    assert snapshot.find_by_topic(20).is_open is False
+    assert snapshot.find_by_user(200).topic_id is None
+
+    # Отсутствующие ключи: меньше минимума, между записями, больше максимума
+    for user_id in (-100, 150, 1000):
+        assert snapshot.find_by_user(user_id) is None
+    for topic_id in (0, 15, 99):
+        assert snapshot.find_by_topic(topic_id) is None
+
+
+def test_empty_snapshot(tmp_path):
+    snapshot = save_and_load(tmp_path, TicketCache())
+    assert snapshot.tickets_count == 0
+    assert snapshot.find_by_user(1) is None
+    assert snapshot.find_by_topic(1) is None
+    assert snapshot.limiter_entries() == {}
+
+
+def test_limiter_section(tmp_path):
+    limiter = RateLimiter(max_messages=5, time_window=60)
+    now = time.time()
+    limiter.user_messages[1] = [now - 10, now - 5, now - 1]
+    limiter.user_messages[2] = [now - 2]
+    # Устаревшие отметки в снимок не попадают
+    limiter.user_messages[3] = [now - 120]
+
+    cache = TicketCache()
+    cache.put(make_ticket(1, 1, 11))
+    snapshot = save_and_load(tmp_path, cache, limiter)
+
+    assert snapshot.limiter_entries() == {1: limiter.user_messages[1], 2: limiter.user_messages[2]}
+    # Секция limiter'а идёт после тикетов и топиков и не сбивает их смещения
+    assert snapshot.find_by_topic(11).user_id == 1
+
+    restored = RateLimiter(max_messages=5, time_window=60)
+    restored.restore(snapshot.limiter_entries())
+    assert restored.user_messages[1] == limiter.user_messages[1]
+
+
+def test_carried_entries(tmp_path):
+    previous = TicketCache()
+    for pk in range(1, 6):
+        previous.put(make_ticket(pk, user_id=pk * 10, topic_id=pk * 100))
+    first = save_and_load(tmp_path, previous)
+
+    cache = TicketCache(capacity=3)
+    cache.fallback = first
+    # Пользователь 20 обращался после запуска - берётся новая запись
+    cache.put(make_ticket(20, user_id=20, topic_id=2000))
+    # Тикет пользователя 30 менялся и вытеснен - старую запись переносить нельзя
+    cache.discard(30)
+
+    second = save_and_load(tmp_path, cache)
+
+    users = [entry.user_id for entry in second.tickets()]
+    assert 30 not in users
+    assert second.find_by_user(20).topic_id == 2000
+    assert second.find_by_topic(200) is None
+    # Из 10, 40, 50 места хватает на две первые по user_id записи
+    assert second.tickets_count == 3
+    assert users == [10, 20, 40]
+
+
+def test_unsupported_file_is_ignored(tmp_path):
+    path = tmp_path / "state.snapshot"
+    path.write_bytes(b"not a snapshot at all, definitely")
+    assert load_snapshot(str(path)) is None
+    assert not path.exists()
+
+
+def test_missing_file(tmp_path):
+    assert load_snapshot(str(tmp_path / "missing.snapshot")) is None
@@ -0,0 +1,68 @@
+"""
+Тесты TicketService: откат создания тикета
+Запуск: python -m pytest
+"""
+import asyncio
+
+from sqlalchemy import select
+
+from database.connection import Database
+from database.models import Ticket
+from services import TicketService, stats, ticket_cache
+
+
+def run_with_db(tmp_path, scenario):
+    async def runner():
+        db = Database(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        await db.init_db()
+        try:
+            async with db.session_factory() as session:
+                await scenario(TicketService(session), session)
+        finally:
+            await db.close()
+
+    asyncio.run(runner())
+
+
+async def create(service: TicketService) -> Ticket:
+    return await service.create_ticket(
+        user_id=42,
+        user_chat_id=42,
+        username="user",
+        full_name="Test User"
+    )
+
+
+def test_delete_ticket_after_create(tmp_path):
+    """Удаление сразу после создания (не удалось создать топик)"""
+    async def scenario(service: TicketService, session):
+        open_before = stats.open_tickets
+        ticket = await create(service)
+        # После delete_ticket атрибуты сброшены откатом
+        pk = ticket.id
+        assert ticket_cache.get_by_user(42) is not None
+
+        await service.delete_ticket(ticket)
+
+        result = await session.execute(select(Ticket))
+        assert result.scalars().all() == []
+        assert ticket_cache.get_by_user(42) is None
+        assert stats.open_tickets == open_before
+        assert pk not in stats.awaiting_response
+
+    run_with_db(tmp_path, scenario)
+
+
+def test_delete_ticket_after_failed_link(tmp_path):
+    """Удаление после несохранённого изменения (не удалось привязать топик)"""
+    async def scenario(service: TicketService, session):
+        ticket = await create(service)
+        ticket.topic_id = 777
+
+        await service.delete_ticket(ticket)
+
+        result = await session.execute(select(Ticket))
+        assert result.scalars().all() == []
+        assert ticket_cache.get_by_user(42) is None
+
+    run_with_db(tmp_path, scenario)
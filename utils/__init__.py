@@ -1,4 +1,31 @@
 from utils.rate_limiter import rate_limiter, RateLimiter
+from utils.throttle import Throttle
+from utils.flood_filter import flood_filter, FloodFilter
+from utils.idempotency import idempotency, IdempotencyMiddleware
+from utils.snapshot import Snapshot, load_snapshot, save_snapshot
+from utils.admission import admission, AdmissionController, Priority
+from utils.http_session import TunedAiohttpSession
+from utils.traffic_recorder import traffic_recorder, TrafficRecorder
+from utils.logging_setup import LogContextMiddleware, bind_log_context, setup_logging
 
-__all__ = ["rate_limiter", "RateLimiter"]
-
+__all__ = [
+    "rate_limiter",
+    "RateLimiter",
+    "Throttle",
+    "flood_filter",
+    "FloodFilter",
+    "idempotency",
+    "IdempotencyMiddleware",
+    "Snapshot",
+    "load_snapshot",
+    "save_snapshot",
+    "admission",
+    "AdmissionController",
+    "Priority",
+    "TunedAiohttpSession",
+    "traffic_recorder",
+    "TrafficRecorder",
+    "LogContextMiddleware",
+    "bind_log_context",
+    "setup_logging",
+]
@@ -0,0 +1,227 @@
+"""
+Контроль нагрузки: ограничение числа одновременно обрабатываемых апдейтов с приоритетами
+При всплеске трафика ответы администраторов и переписка по открытым тикетам
+обрабатываются первыми, создание новых тикетов откладывается или отклоняется
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import (
+    ADMIN_GROUP_ID,
+    ADMISSION_MAX_IN_FLIGHT,
+    ADMISSION_NEW_TICKET_SLOTS,
+    ADMISSION_NEW_TICKET_TIMEOUT,
+    ADMISSION_QUEUE_LIMIT,
+)
+from database import get_db
+from services.ticket_cache import ticket_cache
+from services.ticket_service import TicketService
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_TEXT = (
+    "⏳ Сейчас очень много обращений. "
+    "Пожалуйста, отправьте сообщение ещё раз через пару минут."
+)
+
+
+class Priority(IntEnum):
+    """Классы приоритета (меньше - важнее)"""
+    ADMIN = 0
+    EXISTING = 1
+    NEW = 2
+
+
+class AdmissionController(BaseMiddleware):
+    """
+    Outer-middleware для Dispatcher.update
+
+    Одновременно обрабатывается не больше max_in_flight апдейтов, из них
+    не больше new_ticket_slots - потенциальные новые тикеты (дорогие: топик,
+    профиль, закрепление). Остальные ждут в очереди по приоритету. Новые
+    тикеты отклоняются, если очередь длиннее queue_limit или ожидание
+    дольше new_ticket_timeout секунд.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        new_ticket_slots: int = 8,
+        queue_limit: int = 200,
+        new_ticket_timeout: float = 30.0
+    ):
+        self.max_in_flight = max_in_flight
+        self.new_ticket_slots = min(new_ticket_slots, max_in_flight)
+        self.queue_limit = queue_limit
+        self.new_ticket_timeout = new_ticket_timeout
+
+        self.in_flight = 0
+        self.in_flight_new = 0
+        # (приоритет, порядковый номер, future) - future завершается при выделении слота
+        self.waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+        # Метрики
+        self.admitted = {priority: 0 for priority in Priority}
+        self.deferred = 0
+        self.shed = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        priority = await self.classify(event)
+        if not await self.acquire(priority):
+            await self.reject(event)
+            return None
+
+        try:
+            return await handler(event, data)
+        finally:
+            self.release(priority)
+
+    async def classify(self, event: Update) -> Priority:
+        """
+        Определяет класс приоритета апдейта
+
+        Открытый тикет ищется в кэше, а при промахе (кэш ограничен по размеру
+        и пуст после падения) - в БД по индексу, чтобы активная переписка
+        не попала в очередь новых тикетов
+        """
+        message = event.message
+        if message is None:
+            return Priority.EXISTING
+
+        if str(message.chat.id) == str(ADMIN_GROUP_ID):
+            return Priority.ADMIN
+
+        if (message.text and message.text.startswith("/")) or not message.from_user:
+            return Priority.EXISTING
+
+        cached = ticket_cache.get_by_user(message.from_user.id)
+        if cached is None:
+            try:
+                async with get_db().session_factory() as session:
+                    # Найденный тикет попадает в кэш, обработчик его уже не ищет
+                    ticket = await TicketService(session).get_open_ticket_by_user(message.from_user.id)
+                if ticket:
+                    return Priority.EXISTING
+            except Exception as e:
+                logger.error("Failed to look up open ticket for admission: %s", e)
+                return Priority.EXISTING
+        elif cached.is_open:
+            return Priority.EXISTING
+        return Priority.NEW
+
+    async def acquire(self, priority: Priority) -> bool:
+        """
+        Ждёт свободный слот
+
+        Returns:
+            False, если апдейт отклонён
+        """
+        self._prune()
+        if self._can_admit(priority) and not (self.waiters and self.waiters[0][0] <= priority):
+            self._admit(priority)
+            return True
+
+        if priority == Priority.NEW:
+            if len(self.waiters) >= self.queue_limit:
+                self.shed += 1
+                return False
+            self.deferred += 1
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self._seq), future))
+        try:
+            if priority == Priority.NEW:
+                await asyncio.wait_for(future, self.new_ticket_timeout)
+            else:
+                await future
+            return True
+        except asyncio.TimeoutError:
+            self.shed += 1
+            return False
+        except asyncio.CancelledError:
+            # Слот мог быть выделен одновременно с отменой
+            if future.done() and not future.cancelled():
+                self.release(priority)
+            raise
+
+    def release(self, priority: Priority):
+        """Освобождает слот и передаёт его следующему в очереди"""
+        self.in_flight -= 1
+        if priority == Priority.NEW:
+            self.in_flight_new -= 1
+        self._wake()
+
+    def _can_admit(self, priority: Priority) -> bool:
+        if self.in_flight >= self.max_in_flight:
+            return False
+        return priority != Priority.NEW or self.in_flight_new < self.new_ticket_slots
+
+    def _admit(self, priority: Priority):
+        self.in_flight += 1
+        if priority == Priority.NEW:
+            self.in_flight_new += 1
+        self.admitted[priority] += 1
+
+    def _prune(self):
+        """Убирает из головы очереди отменённые ожидания"""
+        while self.waiters and self.waiters[0][2].done():
+            heapq.heappop(self.waiters)
+
+    def _wake(self):
+        self._prune()
+        while self.waiters and self._can_admit(Priority(self.waiters[0][0])):
+            priority, _, future = heapq.heappop(self.waiters)
+            if future.done():
+                continue
+            self._admit(Priority(priority))
+            future.set_result(None)
+            self._prune()
+
+    async def reject(self, event: Update):
+        """Сообщает пользователю о перегрузке"""
+        logger.warning("Admission: shedding update %s (queue=%s)", event.update_id, len(self.waiters))
+        if event.message:
+            try:
+                await event.message.answer(OVERLOAD_TEXT)
+            except Exception as e:
+                logger.debug("Failed to send overload notice: %s", e)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Текущее состояние для статистики"""
+        queued = {priority: 0 for priority in Priority}
+        for priority, _, future in self.waiters:
+            if not future.done():
+                queued[Priority(priority)] += 1
+        return {
+            "in_flight": self.in_flight,
+            "in_flight_new": self.in_flight_new,
+            "queued": queued,
+            "admitted": dict(self.admitted),
+            "deferred": self.deferred,
+            "shed": self.shed,
+        }
+
+
+# Глобальный экземпляр
+admission = AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    new_ticket_slots=ADMISSION_NEW_TICKET_SLOTS,
+    queue_limit=ADMISSION_QUEUE_LIMIT,
+    new_ticket_timeout=ADMISSION_NEW_TICKET_TIMEOUT
+)
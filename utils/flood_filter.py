@@ -0,0 +1,222 @@
+"""
+Фильтр повторяющихся сообщений
+Повторы одного и того же текста или файла не пересылаются, а сворачиваются в счётчик «×N»
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import Message, TelegramObject
+
+from config import FLOOD_MAX_FINGERPRINTS, FLOOD_WINDOW
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд копить повторы перед обновлением счётчика
+EDIT_DELAY = 2.0
+
+# Сколько пользователей держать в памяти
+MAX_USERS = 10000
+
+# Сколько повторов хранить, пока первое сообщение не переслано
+MAX_PENDING = 10
+
+# Типы медиа, у пересланного сообщения которых есть подпись для счётчика
+CAPTION_MEDIA = ("photo", "video", "document", "voice", "audio", "animation")
+MEDIA = CAPTION_MEDIA + ("video_note", "sticker")
+
+
+@dataclass(slots=True)
+class RecentMessage:
+    """Последнее пересланное сообщение с данным отпечатком"""
+    message_id: int
+    expires_at: float
+    count: int = 1
+    relayed: Optional[Message] = None
+    shown: int = 1
+    edit_task: Optional[asyncio.Task] = None
+    # Отдельное сообщение «×N» для медиа без подписи (стикеры, кружки)
+    counter: Optional[Message] = None
+    # Повторы, пришедшие до пересылки первого сообщения
+    pending: List[Message] = field(default_factory=list)
+
+
+def text_hash(text: Optional[str]) -> str:
+    """Хэш текста без учёта регистра и пробелов"""
+    normalized = " ".join((text or "").casefold().split())
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+
+def fingerprint(message: Message) -> Optional[str]:
+    """
+    Отпечаток сообщения: хэш текста или file_unique_id медиа вместе с хэшем
+    подписи (тот же файл с другой подписью - не повтор)
+    """
+    if message.text:
+        return "t:" + text_hash(message.text)
+    for kind in MEDIA:
+        media = getattr(message, kind)
+        if media:
+            if isinstance(media, list):
+                media = media[-1]
+            return f"f:{media.file_unique_id}:{text_hash(message.caption)}"
+    return None
+
+
+class FloodFilter(BaseMiddleware):
+    """
+    Middleware для сообщений пользователей (до обработчика)
+
+    Для каждого пользователя хранятся отпечатки последних max_per_user
+    сообщений, каждый действует window секунд. Повтор отбрасывается до
+    запросов к БД и Bot API, а к пересланному первому сообщению дописывается
+    счётчик повторов (одно редактирование на пачку повторов), у стикеров и
+    кружков - отдельный ответ «×N». Если первое сообщение так и не переслано,
+    отброшенные повторы обрабатываются заново.
+    """
+
+    def __init__(self, window: float = 60.0, max_per_user: int = 20):
+        self.window = window
+        self.max_per_user = max_per_user
+        self.users: OrderedDict[int, OrderedDict[str, RecentMessage]] = OrderedDict()
+        self.collapsed = 0
+        self._retries: set[asyncio.Task] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if (
+            not isinstance(event, Message)
+            or event.chat.type != "private"
+            or not event.from_user
+            or (event.text and event.text.startswith("/"))
+        ):
+            return await handler(event, data)
+
+        key = fingerprint(event)
+        if key is None:
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        recent = self._recent(user_id)
+        entry = recent.get(key)
+        if entry is not None:
+            entry.count += 1
+            self.collapsed += 1
+            if entry.relayed is None and len(entry.pending) < MAX_PENDING:
+                entry.pending.append(event)
+            logger.info("Collapsed repeated message from user %s (x%s)", user_id, entry.count)
+            self._schedule_edit(entry, data["bot"])
+            return None
+
+        entry = RecentMessage(message_id=event.message_id, expires_at=time.monotonic() + self.window)
+        recent[key] = entry
+        if len(recent) > self.max_per_user:
+            recent.popitem(last=False)
+
+        try:
+            return await handler(event, data)
+        finally:
+            # Сообщение не переслано (лимит, ошибка) - повтор должен пройти,
+            # отброшенные за это время повторы обрабатываются заново
+            if entry.relayed is None and recent.get(key) is entry:
+                del recent[key]
+                if entry.pending:
+                    task = asyncio.create_task(self._process_repeats(handler, entry.pending, data))
+                    self._retries.add(task)
+                    task.add_done_callback(self._retries.discard)
+
+    def track_relay(self, bot: Bot, message: Message, relayed: Optional[Message]):
+        """Запомнить пересланное сообщение, к которому дописывается счётчик"""
+        key = fingerprint(message)
+        recent = self.users.get(message.from_user.id) if key and message.from_user else None
+        entry = recent.get(key) if recent else None
+        if entry is None or entry.message_id != message.message_id or relayed is None:
+            return
+        entry.relayed = relayed
+        entry.pending.clear()
+        # Повторы, пришедшие пока первое сообщение пересылалось
+        if entry.count > entry.shown:
+            self._schedule_edit(entry, bot)
+
+    def _recent(self, user_id: int) -> OrderedDict[str, RecentMessage]:
+        """Отпечатки пользователя без устаревших"""
+        recent = self.users.get(user_id)
+        if recent is None:
+            recent = self.users[user_id] = OrderedDict()
+            if len(self.users) > MAX_USERS:
+                self.users.popitem(last=False)
+        else:
+            self.users.move_to_end(user_id)
+
+        now = time.monotonic()
+        while recent:
+            oldest = next(iter(recent.values()))
+            if oldest.expires_at > now:
+                break
+            recent.popitem(last=False)
+        return recent
+
+    async def _process_repeats(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        repeats: List[Message],
+        data: Dict[str, Any]
+    ):
+        """Обрабатывает повторы по очереди: первый пересылается, остальные сворачиваются в него"""
+        for message in repeats:
+            try:
+                await self(handler, message, dict(data))
+            except Exception as e:
+                logger.error("Failed to process repeated message: %s", e, exc_info=True)
+
+    def _schedule_edit(self, entry: RecentMessage, bot: Bot):
+        if entry.relayed is None or entry.edit_task is not None:
+            return
+        entry.edit_task = asyncio.create_task(self._edit_counter(entry, bot))
+
+    async def _edit_counter(self, entry: RecentMessage, bot: Bot):
+        """Дописывает «×N» к пересланному сообщению после паузы"""
+        await asyncio.sleep(EDIT_DELAY)
+        entry.edit_task = None
+
+        relayed = entry.relayed
+        count = entry.count
+        if count == entry.shown:
+            return
+
+        text = f"{relayed.html_text}\n\n<b>×{count}</b>" if (relayed.text or relayed.caption) else f"<b>×{count}</b>"
+        try:
+            if relayed.text:
+                await bot.edit_message_text(text, chat_id=relayed.chat.id, message_id=relayed.message_id)
+            elif any(getattr(relayed, kind) for kind in CAPTION_MEDIA):
+                await bot.edit_message_caption(chat_id=relayed.chat.id, message_id=relayed.message_id, caption=text)
+            elif entry.counter is None:
+                # Стикер или кружок не редактируются - счётчик отдельным ответом
+                entry.counter = await bot.send_message(
+                    relayed.chat.id,
+                    f"<b>×{count}</b>",
+                    message_thread_id=relayed.message_thread_id,
+                    reply_to_message_id=relayed.message_id
+                )
+            else:
+                await bot.edit_message_text(
+                    f"<b>×{count}</b>",
+                    chat_id=entry.counter.chat.id,
+                    message_id=entry.counter.message_id
+                )
+            entry.shown = count
+        except Exception as e:
+            logger.warning("Failed to update repeat counter: %s", e)
+
+
+# Глобальный экземпляр
+flood_filter = FloodFilter(window=FLOOD_WINDOW, max_per_user=FLOOD_MAX_FINGERPRINTS)
@@ -0,0 +1,187 @@
+"""
+HTTP-сессия для Bot API с раздельными пулами соединений
+Тяжёлые запросы (медиа, long polling) не занимают соединения лёгких текстовых
+"""
+import asyncio
+import logging
+import ssl
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, cast
+
+import certifi
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector, TraceConfig
+
+import aiogram
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые передают медиа или долго держат соединение
+HEAVY_METHODS = frozenset({
+    "getUpdates",
+    "sendPhoto",
+    "sendVideo",
+    "sendDocument",
+    "sendAudio",
+    "sendVoice",
+    "sendVideoNote",
+    "sendAnimation",
+    "sendSticker",
+    "sendMediaGroup",
+    "getFile",
+})
+
+LIGHT = "light"
+HEAVY = "heavy"
+
+
+@dataclass
+class PoolStats:
+    """Статистика пула соединений"""
+    connections_created: int = 0
+    connections_reused: int = 0
+    requests: int = 0
+    errors: int = 0
+
+    @property
+    def reuse_ratio(self) -> float:
+        """Доля запросов, обслуженных уже открытым соединением"""
+        total = self.connections_created + self.connections_reused
+        return self.connections_reused / total if total else 0.0
+
+    @property
+    def requests_per_connection(self) -> float:
+        """Сколько запросов в среднем приходится на одно соединение"""
+        return self.requests / self.connections_created if self.connections_created else 0.0
+
+
+def orjson_dumps(obj: Any) -> str:
+    return orjson.dumps(obj).decode()
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """
+    AiohttpSession с двумя пулами соединений
+
+    Для каждого пула настраиваются размер, keep-alive и DNS-кэш, для методов -
+    таймауты. При fast_json и установленном orjson он используется для
+    разбора ответов и сериализации запросов.
+    """
+
+    def __init__(
+        self,
+        light_limit: int = 50,
+        heavy_limit: int = 20,
+        keepalive_timeout: float = 60.0,
+        dns_cache_ttl: int = 300,
+        light_timeout: float = 10.0,
+        heavy_timeout: float = 60.0,
+        method_timeouts: Optional[Dict[str, float]] = None,
+        fast_json: bool = False,
+        **kwargs: Any
+    ):
+        if fast_json:
+            if orjson is not None:
+                kwargs.setdefault("json_loads", orjson.loads)
+                kwargs.setdefault("json_dumps", orjson_dumps)
+            else:
+                logger.warning("HTTP_FAST_JSON is set but orjson is not installed, using json")
+        super().__init__(**kwargs)
+
+        self.limits = {LIGHT: light_limit, HEAVY: heavy_limit}
+        self.default_timeouts = {LIGHT: light_timeout, HEAVY: heavy_timeout}
+        self.method_timeouts = method_timeouts or {}
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+
+        self.pools: Dict[str, Optional[ClientSession]] = {LIGHT: None, HEAVY: None}
+        self.pool_stats = {LIGHT: PoolStats(), HEAVY: PoolStats()}
+        self._ssl_context = ssl.create_default_context(cafile=certifi.where())
+
+    async def create_session(self) -> ClientSession:
+        """Сессия лёгкого пула (используется базовым классом, например для скачивания файлов)"""
+        return await self.get_pool(LIGHT)
+
+    async def get_pool(self, name: str) -> ClientSession:
+        """Возвращает (при необходимости создаёт) сессию пула"""
+        pool = self.pools[name]
+        if pool is None or pool.closed:
+            connector = TCPConnector(
+                ssl=self._ssl_context,
+                limit=self.limits[name],
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True
+            )
+            pool = self.pools[name] = ClientSession(
+                connector=connector,
+                headers={"User-Agent": f"aiogram/{aiogram.__version__}"},
+                trace_configs=[self._trace_config(self.pool_stats[name])],
+                json_serialize=self.json_dumps
+            )
+        return pool
+
+    async def close(self) -> None:
+        closed = False
+        for name, pool in self.pools.items():
+            if pool is not None and not pool.closed:
+                await pool.close()
+                closed = True
+            self.pools[name] = None
+        if closed:
+            # Даём SSL-соединениям корректно закрыться
+            await asyncio.sleep(0.25)
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+        timeout: Optional[int] = None
+    ) -> TelegramType:
+        api_method = method.__api_method__
+        name = HEAVY if api_method in HEAVY_METHODS else LIGHT
+        session = await self.get_pool(name)
+
+        # Явный таймаут передаёт long polling, он учитывает время ожидания апдейтов
+        if timeout is None:
+            timeout = self.method_timeouts.get(api_method, self.default_timeouts[name])
+
+        url = self.api.api_url(token=bot.token, method=api_method)
+        form = self.build_form_data(bot=bot, method=method)
+
+        try:
+            async with session.post(url, data=form, timeout=ClientTimeout(total=timeout)) as resp:
+                raw_result = await resp.text()
+        except asyncio.TimeoutError:
+            self.pool_stats[name].errors += 1
+            raise TelegramNetworkError(method=method, message="Request timeout error")
+        except ClientError as e:
+            self.pool_stats[name].errors += 1
+            raise TelegramNetworkError(method=method, message=f"{type(e).__name__}: {e}")
+
+        response = self.check_response(bot=bot, method=method, status_code=resp.status, content=raw_result)
+        return cast(TelegramType, response.result)
+
+    @staticmethod
+    def _trace_config(stats: PoolStats) -> TraceConfig:
+        """Счётчики новых и переиспользованных соединений пула"""
+        trace = TraceConfig()
+
+        def counter(field: str) -> Callable[..., Any]:
+            async def increment(session: ClientSession, context: Any, params: Any):
+                setattr(stats, field, getattr(stats, field) + 1)
+            return increment
+
+        trace.on_connection_create_end.append(counter("connections_created"))
+        trace.on_connection_reuseconn.append(counter("connections_reused"))
+        trace.on_request_end.append(counter("requests"))
+        return trace
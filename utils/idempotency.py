@@ -0,0 +1,277 @@
+"""
+Защита от повторной обработки апдейтов
+После падения Telegram повторно отдаёт апдейты, подтверждение которых не успело дойти
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject, Update
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.exc import IntegrityError
+
+from database import get_db
+from database.models import BotState, ProcessedMessage
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_STATE_KEY = "idempotency.watermark"
+
+# Как часто сохранять watermark в БД (секунды)
+SAVE_INTERVAL = 5
+
+# После недели без апдейтов Telegram выбирает следующий update_id случайно,
+# поэтому более старый watermark не используется
+WATERMARK_MAX_AGE = 7 * 24 * 3600
+
+# Апдейт намного ниже watermark - не повтор, а новая случайная нумерация
+RESET_GAP = 10000
+
+# Сколько хранить отметки о начатой обработке сообщений (повторная доставка
+# возможна только в пределах суток) и как часто удалять старые (секунды)
+CLAIM_TTL = timedelta(days=2)
+PRUNE_INTERVAL = 3600
+
+
+class RecentKeys:
+    """Множество последних N ключей: кольцевой буфер + hash set"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ring: deque[Hashable] = deque()
+        self.keys: set[Hashable] = set()
+
+    def add(self, key: Hashable) -> bool:
+        """
+        Добавляет ключ
+
+        Returns:
+            False, если ключ уже встречался
+        """
+        if key in self.keys:
+            return False
+        if len(self.ring) >= self.capacity:
+            self.keys.discard(self.ring.popleft())
+        self.ring.append(key)
+        self.keys.add(key)
+        return True
+
+
+class IdempotencyMiddleware(BaseMiddleware):
+    """
+    Outer-middleware для Dispatcher.update
+
+    Отбрасывает апдейты, которые уже обрабатывались, до вызова любых
+    обработчиков. Недавние update_id и (chat_id, message_id) хранятся в памяти,
+    а в БД сохраняется watermark - update_id, до которого включительно все
+    апдейты обработаны. После перезапуска всё, что не выше watermark, отбрасывается.
+    
+    Watermark покрывает только завершённые апдейты. Апдейт, обработка
+    которого прервалась, распознаётся по отметке claim(), сохраняемой
+    обработчиком до первого побочного эффекта.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.updates = RecentKeys(capacity)
+        self.messages = RecentKeys(capacity)
+        self.in_flight: set[int] = set()
+        self.max_seen = 0
+        self.watermark = 0
+        self.saved_watermark = 0
+        self.dropped = 0
+        self._save_task: Optional[asyncio.Task] = None
+        # Отметки, ожидающие записи: (chat_id, message_id) -> future с результатом claim()
+        self._claims: list[tuple[tuple[int, int], asyncio.Future]] = []
+        self._claim_task: Optional[asyncio.Task] = None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        update_id = event.update_id
+        if update_id < self.watermark - RESET_GAP:
+            self._reset(update_id)
+        
+        if update_id <= self.watermark or not self.updates.add(update_id):
+            self._drop(update_id)
+            return None
+
+        if event.message and not self.messages.add((event.message.chat.id, event.message.message_id)):
+            self._drop(update_id)
+            return None
+
+        self.in_flight.add(update_id)
+        self.max_seen = max(self.max_seen, update_id)
+        try:
+            return await handler(event, data)
+        finally:
+            self.in_flight.discard(update_id)
+            self._advance()
+
+    def _drop(self, update_id: int):
+        self.dropped += 1
+        logger.info("Dropping duplicate update %s", update_id)
+
+    def _reset(self, update_id: int):
+        """Сбрасывает watermark: Telegram начал новую нумерацию апдейтов"""
+        logger.warning("Update %s is far below watermark %s, resetting watermark", update_id, self.watermark)
+        self.watermark = 0
+        self.max_seen = 0
+    
+    async def claim(self, message: Message) -> bool:
+        """
+        Отметить начало обработки сообщения (до первого побочного эффекта)
+        
+        Отметки одновременно обрабатываемых сообщений записываются одной
+        транзакцией (group commit): под нагрузкой на пачку сообщений
+        приходится один commit.
+        
+        Returns:
+            False, если обработка этого сообщения уже начиналась
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._claims.append(((message.chat.id, message.message_id), future))
+        if self._claim_task is None:
+            self._claim_task = asyncio.create_task(self._write_claims())
+        claimed = await future
+        if not claimed:
+            logger.info("Message %s in chat %s was already processed", message.message_id, message.chat.id)
+        return claimed
+    
+    async def _write_claims(self):
+        # Даём обработчикам, запущенным в этом же цикле, добавить свои отметки
+        await asyncio.sleep(0)
+        batch, self._claims = self._claims, []
+        # Отметки, пришедшие во время записи, попадут в следующую пачку
+        self._claim_task = None
+        
+        try:
+            new_keys = await self._insert_claims([key for key, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        seen = set()
+        for key, future in batch:
+            if not future.done():
+                future.set_result(key in new_keys and key not in seen)
+            seen.add(key)
+    
+    async def _insert_claims(self, keys: list[tuple[int, int]]) -> set[tuple[int, int]]:
+        """Записывает отметки, которых ещё нет; возвращает записанные"""
+        async with get_db().session_factory() as session:
+            result = await session.execute(
+                select(ProcessedMessage.chat_id, ProcessedMessage.message_id)
+                .where(tuple_(ProcessedMessage.chat_id, ProcessedMessage.message_id).in_(keys))
+            )
+            new_keys = set(keys) - {tuple(row) for row in result.all()}
+            session.add_all([
+                ProcessedMessage(chat_id=chat_id, message_id=message_id)
+                for chat_id, message_id in new_keys
+            ])
+            try:
+                await session.commit()
+                return new_keys
+            except IntegrityError:
+                await session.rollback()
+        
+        # Отметку успели записать в другой транзакции (create_ticket) - по одной
+        claimed = set()
+        for chat_id, message_id in new_keys:
+            async with get_db().session_factory() as session:
+                session.add(ProcessedMessage(chat_id=chat_id, message_id=message_id))
+                try:
+                    await session.commit()
+                    claimed.add((chat_id, message_id))
+                except IntegrityError:
+                    pass
+        return claimed
+    
+    async def prune(self):
+        """Удалить старые отметки о начатой обработке"""
+        async with get_db().session_factory() as session:
+            await session.execute(
+                delete(ProcessedMessage).where(ProcessedMessage.created_at < datetime.utcnow() - CLAIM_TTL)
+            )
+            await session.commit()
+    
+    def _advance(self):
+        """Сдвигает watermark до последнего апдейта, перед которым нет незавершённых"""
+        if self.in_flight:
+            watermark = min(self.in_flight) - 1
+        else:
+            watermark = self.max_seen
+        self.watermark = max(self.watermark, watermark)
+
+    async def load(self):
+        """Загрузить watermark при запуске"""
+        async with get_db().session_factory() as session:
+            state = await session.get(BotState, WATERMARK_STATE_KEY)
+        if not state:
+            return
+        try:
+            data = json.loads(state.value)
+            watermark, saved_at = int(data["watermark"]), float(data["saved_at"])
+        except (ValueError, TypeError, KeyError):
+            logger.warning("Ignoring update watermark in old format")
+            return
+        if time.time() - saved_at > WATERMARK_MAX_AGE:
+            logger.info("Update watermark %s is older than a week, ignoring", watermark)
+            return
+        self.watermark = self.saved_watermark = watermark
+        logger.info("Update watermark: %s", self.watermark)
+
+    async def save(self):
+        """Сохранить watermark, если он изменился"""
+        watermark = self.watermark
+        if watermark == self.saved_watermark:
+            return
+        async with get_db().session_factory() as session:
+            value = json.dumps({"watermark": watermark, "saved_at": time.time()})
+            await session.merge(BotState(key=WATERMARK_STATE_KEY, value=value))
+            await session.commit()
+        self.saved_watermark = watermark
+
+    def start(self):
+        """Запустить периодическое сохранение watermark"""
+        if self._save_task is None:
+            self._save_task = asyncio.create_task(self._save_loop())
+
+    async def stop(self):
+        """Остановить периодическое сохранение и сохранить watermark"""
+        if self._save_task is not None:
+            self._save_task.cancel()
+            self._save_task = None
+        await self.save()
+
+    async def _save_loop(self):
+        last_prune = 0.0
+        while True:
+            await asyncio.sleep(SAVE_INTERVAL)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.error("Failed to save update watermark: %s", e)
+            
+            if time.monotonic() - last_prune >= PRUNE_INTERVAL:
+                last_prune = time.monotonic()
+                try:
+                    await self.prune()
+                except Exception as e:
+                    logger.error("Failed to prune processed messages: %s", e)
+
+
+# Глобальный экземпляр
+idempotency = IdempotencyMiddleware()
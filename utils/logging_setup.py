@@ -0,0 +1,181 @@
+"""
+Логирование без блокировки event loop
+Записи кладутся в очередь, форматирование и вывод выполняет фоновый поток
+"""
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Контекст текущего апдейта (update_id, user_id, ticket_id), попадает в каждую запись
+log_context: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+
+def bind_log_context(**fields: Any):
+    """Добавить поля в контекст логирования текущей задачи"""
+    log_context.set({**log_context.get(), **fields})
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    QueueHandler, который не форматирует запись в вызывающем потоке
+
+    Стандартный prepare() форматирует сообщение и traceback сразу, здесь это
+    делает фоновый поток. Контекст сохраняется в записи, так как contextvars
+    в другом потоке недоступны.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.context = log_context.get()
+        return record
+
+
+class RepeatedLogFilter(logging.Filter):
+    """
+    Ограничивает повторяющиеся предупреждения и ошибки
+
+    Для каждого шаблона сообщения пропускается не больше burst записей
+    за window секунд. Первая запись следующего окна получает поле
+    suppressed с количеством отброшенных.
+    """
+
+    def __init__(self, burst: int = 5, window: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        # (logger, level, шаблон) -> [начало окна, пропущено, отброшено]
+        self.counters: Dict[tuple, list] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            state = self.counters.get(key)
+            if state is None or now - state[0] >= self.window:
+                if state and state[2]:
+                    record.suppressed = state[2]
+                self.counters[key] = [now, 1, 0]
+                return True
+
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+
+            state[2] += 1
+            return False
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю INFO-записей обработчиков (по сообщению на каждую пересылку)"""
+
+    def __init__(self, rate: float, prefixes: tuple[str, ...] = ("handlers",)):
+        super().__init__()
+        self.rate = rate
+        self.prefixes = prefixes
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.INFO or not record.name.startswith(self.prefixes):
+            return True
+        return random.random() < self.rate
+
+
+class TextFormatter(logging.Formatter):
+    """Текстовый формат с контекстом в конце строки"""
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = super().formatMessage(record)
+        context = getattr(record, "context", None)
+        if context:
+            line += " [" + " ".join(f"{key}={value}" for key, value in context.items()) + "]"
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            line += f" (ещё {suppressed} похожих записей отброшено)"
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Структурированный формат: одна JSON-запись на строку"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update(getattr(record, "context", None) or {})
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            data["suppressed"] = suppressed
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Outer-middleware для Dispatcher.update: заполняет контекст логирования"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        context: Dict[str, Any] = {}
+        if isinstance(event, Update):
+            context["update_id"] = event.update_id
+        user = data.get("event_from_user")
+        if user:
+            context["user_id"] = user.id
+
+        token = log_context.set(context)
+        try:
+            return await handler(event, data)
+        finally:
+            log_context.reset(token)
+
+
+def setup_logging(
+    level: str = "INFO",
+    json_format: bool = False,
+    info_sample_rate: float = 1.0,
+    error_burst: int = 5
+) -> QueueListener:
+    """
+    Настраивает корневой логгер: очередь + фоновый поток вывода в stdout
+
+    Returns:
+        QueueListener, который нужно остановить при завершении (stop() дописывает очередь)
+    """
+    log_queue: SimpleQueue = SimpleQueue()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if json_format else TextFormatter(TEXT_FORMAT))
+
+    queue_handler = ContextQueueHandler(log_queue)
+    queue_handler.addFilter(RepeatedLogFilter(burst=error_burst))
+    if info_sample_rate < 1.0:
+        queue_handler.addFilter(SamplingFilter(info_sample_rate))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    return listener
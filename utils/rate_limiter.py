@@ -50,6 +50,21 @@ class RateLimiter:
         async with self.lock:
             if user_id in self.user_messages:
                 del self.user_messages[user_id]
+    
+    def dump(self) -> Dict[int, list[float]]:
+        """Текущие окна пользователей (без устаревших отметок) для снимка состояния"""
+        now = time.time()
+        result = {}
+        for user_id, messages in self.user_messages.items():
+            recent = [msg_time for msg_time in messages if now - msg_time < self.time_window]
+            if recent:
+                result[user_id] = recent
+        return result
+    
+    def restore(self, data: Dict[int, list[float]]):
+        """Восстановить окна пользователей из снимка состояния"""
+        for user_id, messages in data.items():
+            self.user_messages[user_id] = list(messages)
 
 
 # Глобальный экземпляр
@@ -0,0 +1,168 @@
+"""
+Снимок состояния для быстрого перезапуска
+При остановке окна rate limiter'а и кэш тикетов сохраняются в бинарный файл,
+при запуске файл отображается в память и читается по мере обращений
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from services.ticket_cache import CachedTicket, TicketCache
+from utils.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"STBS"
+VERSION = 1
+
+# magic, версия, время создания, число тикетов, число топиков, число пользователей limiter'а
+HEADER = struct.Struct("<4sHdIII")
+# user_id, Ticket.id, user_chat_id, topic_id (0 - нет), ticket_id, открыт
+TICKET = struct.Struct("<qqqq20s?")
+# topic_id, номер записи тикета
+TOPIC = struct.Struct("<qI")
+# user_id, число отметок времени (за ними следуют сами отметки, double)
+LIMITER_USER = struct.Struct("<qH")
+USER_ID = struct.Struct("<q")
+
+
+class Snapshot:
+    """
+    Снимок, отображённый в память
+
+    Тикеты отсортированы по user_id, индекс топиков - по topic_id, поэтому
+    поиск идёт бинарным поиском прямо по файлу, без загрузки всех записей.
+    """
+
+    def __init__(self, buffer: mmap.mmap):
+        self.buffer = buffer
+        magic, version, self.created_at, self.tickets_count, self.topics_count, self.limiter_count = (
+            HEADER.unpack_from(buffer, 0)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Unsupported snapshot format")
+
+        self.tickets_offset = HEADER.size
+        self.topics_offset = self.tickets_offset + self.tickets_count * TICKET.size
+        self.limiter_offset = self.topics_offset + self.topics_count * TOPIC.size
+
+    def find_by_user(self, user_id: int) -> Optional[CachedTicket]:
+        """Найти тикет пользователя"""
+        index = bisect_left(range(self.tickets_count), user_id, key=self._ticket_user_id)
+        if index < self.tickets_count and self._ticket_user_id(index) == user_id:
+            return self._ticket(index)
+        return None
+
+    def find_by_topic(self, topic_id: int) -> Optional[CachedTicket]:
+        """Найти тикет по топику"""
+        index = bisect_left(range(self.topics_count), topic_id, key=self._topic_id)
+        if index < self.topics_count:
+            found_topic_id, ticket_index = TOPIC.unpack_from(self.buffer, self.topics_offset + index * TOPIC.size)
+            if found_topic_id == topic_id:
+                return self._ticket(ticket_index)
+        return None
+
+    def tickets(self) -> list[CachedTicket]:
+        """Все тикеты снимка"""
+        return [self._ticket(index) for index in range(self.tickets_count)]
+
+    def limiter_entries(self) -> dict[int, list[float]]:
+        """Окна rate limiter'а"""
+        entries = {}
+        offset = self.limiter_offset
+        for _ in range(self.limiter_count):
+            user_id, count = LIMITER_USER.unpack_from(self.buffer, offset)
+            offset += LIMITER_USER.size
+            entries[user_id] = list(struct.unpack_from(f"<{count}d", self.buffer, offset))
+            offset += count * 8
+        return entries
+
+    def _ticket_user_id(self, index: int) -> int:
+        return USER_ID.unpack_from(self.buffer, self.tickets_offset + index * TICKET.size)[0]
+
+    def _topic_id(self, index: int) -> int:
+        return USER_ID.unpack_from(self.buffer, self.topics_offset + index * TOPIC.size)[0]
+
+    def _ticket(self, index: int) -> CachedTicket:
+        user_id, pk, user_chat_id, topic_id, ticket_id, is_open = TICKET.unpack_from(
+            self.buffer, self.tickets_offset + index * TICKET.size
+        )
+        return CachedTicket(
+            pk=pk,
+            ticket_id=ticket_id.rstrip(b"\0").decode("ascii"),
+            user_id=user_id,
+            user_chat_id=user_chat_id,
+            topic_id=topic_id or None,
+            is_open=is_open
+        )
+
+
+def save_snapshot(path: str, limiter: RateLimiter, cache: TicketCache):
+    """Сохраняет снимок (атомарно, через временный файл)"""
+    entries = cache.entries()
+    # Записи прошлого снимка, к которым не обращались, переносим в новый
+    if isinstance(cache.fallback, Snapshot):
+        known = {entry.user_id for entry in entries} | cache.shadowed
+        carried = [entry for entry in cache.fallback.tickets() if entry.user_id not in known]
+        room = cache.capacity - len(entries)
+        if room > 0:
+            entries = carried[:room] + entries
+
+    tickets = sorted(entries, key=lambda entry: entry.user_id)
+    topics = sorted(
+        (entry.topic_id, index) for index, entry in enumerate(tickets) if entry.topic_id is not None
+    )
+    limiter_data = limiter.dump()
+
+    parts = [HEADER.pack(MAGIC, VERSION, time.time(), len(tickets), len(topics), len(limiter_data))]
+    for entry in tickets:
+        parts.append(TICKET.pack(
+            entry.user_id,
+            entry.pk,
+            entry.user_chat_id,
+            entry.topic_id or 0,
+            entry.ticket_id.encode("ascii"),
+            entry.is_open
+        ))
+    for topic_id, index in topics:
+        parts.append(TOPIC.pack(topic_id, index))
+    for user_id, messages in limiter_data.items():
+        messages = messages[-0xFFFF:]
+        parts.append(LIMITER_USER.pack(user_id, len(messages)))
+        parts.append(struct.pack(f"<{len(messages)}d", *messages))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"".join(parts))
+    os.replace(tmp_path, path)
+    logger.info("Snapshot saved: %s tickets, %s rate-limited users", len(tickets), len(limiter_data))
+
+
+def load_snapshot(path: str) -> Optional[Snapshot]:
+    """
+    Отображает снимок в память
+
+    Файл удаляется сразу после открытия: если бот упадёт, не сохранив
+    новый снимок, при следующем запуске устаревшие данные не загрузятся.
+    """
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        snapshot = Snapshot(buffer)
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning("Failed to load snapshot %s: %s", path, e)
+        snapshot = None
+
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning("Failed to remove snapshot %s: %s", path, e)
+
+    return snapshot
@@ -0,0 +1,45 @@
+"""
+Ограничение скорости исходящих вызовов Bot API
+"""
+import asyncio
+import time
+
+
+class Throttle:
+    """
+    Token bucket для фоновых задач, которые шлют много запросов подряд
+    
+    Telegram допускает ~30 сообщений в секунду от бота и ~20 в минуту в одну
+    группу, поэтому массовые операции должны идти с ограниченной скоростью.
+    """
+    
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: Количество вызовов в секунду
+            burst: Сколько вызовов можно сделать подряд без ожидания
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Дождаться разрешения на следующий вызов"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def pause(self, seconds: float):
+        """Приостановить выдачу токенов (после TelegramRetryAfter)"""
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+        self.updated_at = time.monotonic()
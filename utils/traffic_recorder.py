@@ -0,0 +1,203 @@
+"""
+Запись входящих апдейтов и запросов к Bot API для последующего воспроизведения (replay.py)
+Журнал - gzip с JSON-записью на строку, только дописывается
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+
+from config import ADMIN_GROUP_ID, ADMIN_IDS, BOT_TOKEN, RECORD_PATH, RECORD_SALT
+
+logger = logging.getLogger(__name__)
+
+# Как часто дописывать буфер в журнал (секунды) и при каком размере дописывать сразу
+FLUSH_INTERVAL = 5
+FLUSH_SIZE = 500
+
+# Поля с именами и названиями заменяются целиком
+NAME_FIELDS = frozenset({"first_name", "last_name", "username", "title", "phone_number"})
+# Текст (кроме команд) заменяется строкой той же длины из ключевого хэша:
+# одинаковые тексты остаются одинаковыми, разные - разными
+TEXT_FIELDS = frozenset({"text", "caption"})
+
+
+class TrafficRecorder(BaseMiddleware):
+    """
+    Outer-middleware для Dispatcher.update и middleware сессии бота
+
+    Апдейты пишутся с временем поступления и длительностью обработки, запросы
+    к Bot API - с методом и длительностью. ID пользователей и чатов заменяются
+    стабильными хэшами (одинаковый ID - одинаковый хэш), имена и текст
+    сообщений не сохраняются. Запись в файл выполняется в отдельном потоке.
+    """
+
+    def __init__(self, path: str, salt: str):
+        self.path = path
+        self.key = hashlib.sha256(salt.encode()).digest()
+        self.buffer: List[str] = []
+        self.recorded = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        # Ссылки на внеочередные сбросы, чтобы их не собрал GC
+        self._flushes: set[asyncio.Task] = set()
+        self._write_lock = asyncio.Lock()
+        self.api_middleware = RecordingRequestMiddleware(self)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        received_at = time.time()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.write({
+                "type": "update",
+                "ts": received_at,
+                "duration": time.perf_counter() - started,
+                "update": self.scrub(event.model_dump(mode="json", by_alias=True, exclude_none=True)),
+            })
+
+    def anonymize(self, value: int) -> int:
+        """Стабильный хэш ID (знак сохраняется: у групп ID отрицательные)"""
+        digest = hashlib.blake2b(str(value).encode(), key=self.key, digest_size=6).digest()
+        hashed = int.from_bytes(digest, "big") or 1
+        return -hashed if value < 0 else hashed
+
+    def mask_text(self, text: str) -> str:
+        """
+        Заменитель текста той же длины, зависящий только от текста и ключа
+
+        Хэшируется нормализованный текст (как в FloodFilter), пробелы остаются
+        на месте: тексты, отличающиеся только регистром и пробелами, и после
+        замены считаются повтором
+        """
+        normalized = " ".join(text.casefold().split())
+        seed = hashlib.blake2b(normalized.encode(), key=self.key).digest()
+        stream = iter(hashlib.shake_256(seed).hexdigest(len(text)))
+        return "".join(char if char.isspace() else next(stream) for char in text)
+
+    def scrub(self, value: Any) -> Any:
+        """Заменяет ID, имена и текст в сериализованном апдейте"""
+        if isinstance(value, list):
+            return [self.scrub(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        result = {}
+        for key, item in value.items():
+            if key in ("id", "user_id") and isinstance(item, int):
+                item = self.anonymize(item)
+            elif key in NAME_FIELDS and isinstance(item, str):
+                item = "anon"
+            elif key in TEXT_FIELDS and isinstance(item, str):
+                # Команды нужны для воспроизведения, остальной текст - нет
+                if not item.startswith("/"):
+                    item = self.mask_text(item)
+            else:
+                item = self.scrub(item)
+            result[key] = item
+        return result
+
+    def write(self, record: Dict[str, Any]):
+        """Добавить запись в буфер"""
+        self.buffer.append(json.dumps(record, ensure_ascii=False) + "\n")
+        self.recorded += 1
+        if len(self.buffer) >= FLUSH_SIZE:
+            task = asyncio.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        """Дописать буфер в журнал (каждый сброс - отдельный gzip-блок)"""
+        async with self._write_lock:
+            if not self.buffer:
+                return
+            lines, self.buffer = self.buffer, []
+            await asyncio.to_thread(self._append, lines)
+
+    def _append(self, lines: List[str]):
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def start(self):
+        """Записать заголовок сеанса и запустить периодический сброс"""
+        if not self.enabled or self._flush_task is not None:
+            return
+        # По заголовку replay.py настраивает админ-группу и администраторов
+        self.write({
+            "type": "meta",
+            "ts": time.time(),
+            "admin_group_id": self.anonymize(int(ADMIN_GROUP_ID)) if ADMIN_GROUP_ID else None,
+            "admin_ids": [self.anonymize(admin_id) for admin_id in ADMIN_IDS],
+        })
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info("Recording traffic to %s", self.path)
+
+    async def stop(self):
+        """Остановить периодический сброс и дописать буфер"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Failed to write traffic log: %s", e)
+
+
+class RecordingRequestMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: записывает метод и длительность каждого запроса"""
+
+    def __init__(self, recorder: TrafficRecorder):
+        self.recorder = recorder
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        sent_at = time.time()
+        started = time.perf_counter()
+        error = None
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.recorder.write({
+                "type": "api",
+                "ts": sent_at,
+                "method": method.__api_method__,
+                "duration": time.perf_counter() - started,
+                "error": error,
+            })
+
+
+# Глобальный экземпляр (выключен, если RECORD_PATH не задан)
+traffic_recorder = TrafficRecorder(RECORD_PATH, RECORD_SALT or BOT_TOKEN)